@@ -0,0 +1,154 @@
+from gstuff.clients import ClientPool
+from gstuff.executor import RequestExecutor
+from gstuff.fake import FakeCredentials
+from gstuff.fake import FakeGoogle
+from gstuff.gsht import Workbook
+import googlesheetssettings as gss
+import vs_creator
+import argparse
+import contextlib
+import io
+import random
+import tracemalloc
+
+
+# build synthetic source workbooks laid out like the ones vs_creator reads: two header rows, the
+# metadata (name/value pairs) in columns A and B, and code/description pairs in columns C to O
+
+HEADERS = ['', '', 'ICD10', 'ICD10 description', 'Medcode', 'SNOMED', 'SNOMED description',
+           'Medcode description', 'OPCS', 'OPCS description', 'Prod', 'zyxw', 'Drug description',
+           'Generic', 'Generic category', 'category']
+
+
+def synthetic_tab(n, rows, rng):
+    values = [['Value set'] + [''] * 15, list(HEADERS)]
+    metadata = [['Filename', f'Condition_{n}_Dx'], ['Label', f'Condition {n}'],
+                ['Description', f'Synthetic condition {n}'], ['Intent', ''], ['Concept', f'condition-{n}']]
+    intensional = n % 4 == 0
+    for r in range(rows):
+        row = [''] * 16
+        if r < len(metadata):
+            row[0], row[1] = metadata[r]
+        row[2] = f'A{rng.randint(0, 99):02d}.x' if intensional and r < 3 else f'A{rng.randint(0, 99):02d}.{r % 10}'
+        row[3] = f'ICD term {r}'
+        row[4] = str(rng.randint(100000, 999999))
+        row[5] = f'{rng.randint(1, 9)}.{rng.randint(10000, 99999)}E+14'
+        row[6] = f'SNOMED term\n{r}'
+        row[7] = f'Medcode term {r}'
+        if n % 3 == 0:
+            row[8] = f'K{rng.randint(10, 99)}.{r % 10}'
+            row[9] = f'OPCS term {r}'
+        if n % 5 == 0:
+            row[10] = str(rng.randint(10 ** 9, 10 ** 10))
+            row[11] = str(rng.randint(10 ** 9, 10 ** 10))
+            row[12] = f'Drug {r}'
+            row[13] = f'generic{r % 7}'
+            row[14] = f'class{r % 3}'
+        values.append(row)
+    return values
+
+
+def synthetic_source_workbook(google, tabs, rows, seed=0):
+    rng = random.Random(seed)
+    sheets = {f'Tab {n}': synthetic_tab(n, rows, rng) for n in range(1, tabs + 1)}
+    return google.add_spreadsheet(f'Synthetic source ({tabs} tabs)', sheets)
+
+
+# pipelines; each takes a fresh FakeGoogle, the id of a synthetic source workbook and the options
+
+def load_per_tab(google, pool, source_id, options):
+    wb = Workbook(source_id, pool.sheets_service(), executor=pool.executor)
+    for sheet in wb.sheets.values():
+        sheet.values
+
+
+def load_bulk(google, pool, source_id, options):
+    Workbook(source_id, pool.sheets_service(), bulk=True, executor=pool.executor)
+
+
+def vs_contents(n):
+    desc_vals = [['Label', f'Value set {n}'], ['Content Type', 'concepts']]
+    cont_vals = [['Label', 'Code', 'System', 'Note']] + [[f'term {i}', str(i), 'SNOMED', ''] for i in range(50)]
+    return desc_vals, cont_vals
+
+
+def create_classic(google, pool, source_id, options):
+    gsm = pool.gsm()
+    for n in range(options.value_sets):
+        desc_vals, cont_vals = vs_contents(n)
+        value_set = gsm.create_vs_workbook(f'Value set {n}', 'concepts', desc_vals, cont_vals)
+        pool.drive().move(value_set.file_id, None, gss.STAGING_FOLDER_ID)
+
+
+def create_fast(google, pool, source_id, options):
+    gsm = pool.gsm()
+    for n in range(options.value_sets):
+        desc_vals, cont_vals = vs_contents(n)
+        gsm.create_vs_workbook(f'Value set {n}', 'concepts', desc_vals, cont_vals, gss.STAGING_FOLDER_ID, fast=True)
+
+
+def run_vs_creator(google, pool, source_id, options):
+    vs_creator.main([source_id], pool=pool)
+
+
+PIPELINES = {
+    'load-per-tab': load_per_tab,
+    'load-bulk': load_bulk,
+    'create-classic': create_classic,
+    'create-fast': create_fast,
+    'vs-creator': run_vs_creator,
+}
+
+
+def run_pipeline(name, options):
+    """ run one pipeline against a fresh fake backend and return its measurements """
+    google = FakeGoogle(latency=options.latency)
+    google.add_folder('Staging', file_id=gss.STAGING_FOLDER_ID)
+    google.add_folder('Intensional', file_id=gss.INTENSIONAL_FOLDER_ID)
+    source_id = synthetic_source_workbook(google, options.tabs, options.rows, options.seed)
+    google.reset_counters()
+    executor = RequestExecutor(clock=google.clock.now, sleep=google.clock.sleep)
+    pool = ClientPool(credentials=FakeCredentials(), executor=executor, build_service=google.build)
+    start = google.clock.now()
+    tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()):
+        PIPELINES[name](google, pool, source_id, options)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        'pipeline': name,
+        'calls': google.total_calls,
+        'retries': sum(stats['retries'] for stats in executor.stats.values()),
+        'bytes': google.bytes_sent + google.bytes_received,
+        'seconds': google.clock.now() - start,
+        'peak_mb': peak / 1024 / 1024,
+        'detail': google.summary(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure API calls, simulated time and memory of the gstuff '
+                                                 'pipelines against the offline fake Sheets/Drive backend.')
+    parser.add_argument('pipelines', nargs='*', help=f"pipelines to run: {', '.join(PIPELINES)} (default: all)")
+    parser.add_argument('--tabs', type=int, default=60, help='tabs in the synthetic source workbook')
+    parser.add_argument('--rows', type=int, default=100, help='rows per tab')
+    parser.add_argument('--value-sets', type=int, default=20, help='value sets created by the create-* pipelines')
+    parser.add_argument('--latency', type=float, default=0.2, help='simulated seconds per call')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--verbose', action='store_true', help='show the calls made per method')
+    options = parser.parse_args()
+    for name in options.pipelines:
+        if name not in PIPELINES:
+            parser.error(f'unknown pipeline: {name}')
+
+    print(f"{'pipeline':<16}{'calls':>8}{'retries':>9}{'bytes':>12}{'sim. time':>12}{'peak MB':>10}")
+    for name in options.pipelines or PIPELINES:
+        result = run_pipeline(name, options)
+        print(f"{result['pipeline']:<16}{result['calls']:>8}{result['retries']:>9}{result['bytes']:>12}"
+              f"{result['seconds']:>11.1f}s{result['peak_mb']:>10.1f}")
+        if options.verbose:
+            print(result['detail'])
+
+
+if __name__ == '__main__':
+    main()
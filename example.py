@@ -1,64 +1,42 @@
+from gstuff.cache import WorkbookCache
 from gstuff.gdrv import Drive
 from gstuff.gsht import GSManager
+from gstuff.validate import References
+from gstuff.validate import Table
+from gstuff.validate import print_issues
+from gstuff.validate import validate
 import googlesheetssettings as gss
 
 
 def main():
     """make sure all of the data variables in the Statements sheet are defined first in the Data Variables sheet"""
 
-    # define some variables
-    issues = []
-    dv_header_rows = 3
-    stmt_header_rows = 3
-
     # create a Google Drive wrapper object
     drive = Drive()
 
     # create a Google Sheet Manager object
     gsm = GSManager(drive.credentials)
 
-    # get a "workbook", aka a full spreadsheet, not just one tab
-    wb = gsm.get_workbook(gss.STATEMENT_SHEET_ID)
-
-    # get a "sheet", aka a tab in a workbook
-    statement_sheet = wb.sheets.get('Statements')
+    # keep local copies of workbooks; they are only downloaded again when they change on Drive
+    cache = WorkbookCache(drive)
 
-    # get another "sheet"
-    data_variable_sheet = wb.sheets.get('Data Variables')
+    # get a "workbook", aka a full spreadsheet, not just one tab
+    wb = gsm.get_workbook(gss.STATEMENT_SHEET_ID, cache=cache)
 
+    # the rows after the three header rows whose directive (column A) is 'ready'; columns are 0-based
+    data_variables = Table('Data Variables', first_row=3, directive=0)
+    statements = Table('Statements', first_row=3, directive=0, key=3)
 
-    # make a list of all of the data variables that have been defined in the Data Variables sheet
-    dv_handles = []
-    if data_variable_sheet.rows > dv_header_rows:
-        for i in range(dv_header_rows, data_variable_sheet.rows):
-            if data_variable_sheet.values[i][0] == 'ready':
-                # get data variable handle
-                dv_handle = data_variable_sheet.values[i][1]
-                # add data variable handle to 'dv_handles' if it's not already there
-                if dv_handle not in dv_handles:
-                    dv_handles.append(dv_handle)
-    
-    # check to see if the data variables in the Statements sheet are in 'dv_handles'
-    if statement_sheet.rows > stmt_header_rows:
-        for i in range(stmt_header_rows, statement_sheet.rows):
-            if statement_sheet.values[i][0] == 'ready':
-                # get the data variable handle
-                stmt_dv_handle = statement_sheet.values[i][6]
-                # look for the handle
-                if stmt_dv_handle not in dv_handles:
-                    # the handle in the Statements sheet may be missing the 'nvdnc-ns::' prefix, so check for that
-                    if 'nvdnc-ns::' + stmt_dv_handle not in dv_handles:
-                        issues.append(f'Data variable not found.\nStatement handle: {statement_sheet.values[i][3]}\nData variable: {stmt_dv_handle}')
+    # the data variable of each statement (column G) must be the handle (column B) of a data variable; the handle in
+    # the Statements sheet may be missing the 'nvdnc-ns::' prefix
+    checks = [
+        (statements, [References(6, data_variables, 1, prefixes=['nvdnc-ns::'], label='Data variable')]),
+    ]
 
-    # display the results
-    if issues:
-        for issue in issues:
-            print(issue)
-    else:
-        print('No issues found.')
+    # both tabs are loaded in one call and each is read once
+    print_issues(validate(wb, checks))
 
 
 
 if __name__ == '__main__':
     main()
-
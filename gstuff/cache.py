@@ -0,0 +1,102 @@
+from gstuff.gsht import Workbook
+import json
+import logging
+import os
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_CACHE_DIR = '.gstuff_cache'
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class WorkbookCache:
+    """An on-disk cache of workbook snapshots (see Workbook.snapshot), one JSON file per workbook.
+
+    A snapshot is stored with the Drive version (or modifiedTime) of the file it was taken from. get_workbook makes
+    one Drive metadata call and only downloads the workbook when that version has changed. When the cache grows
+    beyond "max_bytes" the least recently used snapshots are removed.
+    """
+
+    def __init__(self, drive, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.drive = drive
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, file_id):
+        return os.path.join(self.directory, f'{file_id}.json')
+
+    def version(self, file_id):
+        """Return the current Drive version of a file, or None if it could not be read."""
+        metadata = self.drive.get_metadata(file_id)
+        if not metadata:
+            return None
+        return str(metadata.get('version') or metadata.get('modifiedTime') or '') or None
+
+    def load(self, file_id, version):
+        """Return the cached snapshot of "file_id" if it was taken at "version", otherwise None."""
+        path = self._path(file_id)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get('version') != version:
+            return None
+        # Mark the entry as recently used.
+        os.utime(path)
+        return entry.get('snapshot')
+
+    def store(self, file_id, version, snapshot):
+        path = self._path(file_id)
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': version, 'snapshot': snapshot}, f)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used snapshots until the cache is no larger than max_bytes."""
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith('.json'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                    logger.debug(f'Evicted {path} from the workbook cache')
+                except OSError:
+                    pass
+
+    def get_workbook(self, gsm, file_id, columnar=False):
+        """Return the workbook "file_id", from the cache if it has not changed on Drive, otherwise loaded through
+        "gsm" (in bulk) and stored in the cache."""
+        version = self.version(file_id)
+        if version is not None:
+            snapshot = self.load(file_id, version)
+            if snapshot is not None:
+                self.hits += 1
+                logger.info(f'Workbook {file_id} (version {version}) loaded from cache')
+                return Workbook(file_id, gsm.service, executor=gsm.executor, snapshot=snapshot, columnar=columnar)
+        self.misses += 1
+        wb = Workbook(file_id, gsm.service, bulk=True, executor=gsm.executor, columnar=columnar)
+        if version is not None and wb.name:
+            self.store(file_id, version, wb.snapshot())
+        return wb
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.json'):
+                os.remove(entry.path)
@@ -0,0 +1,91 @@
+import logging
+import threading
+from google.auth.transport.requests import Request
+from googleapiclient.discovery import build
+from gstuff import gdrv
+from gstuff.executor import get_executor
+from gstuff.gdrv import Drive
+from gstuff.gsht import GSManager
+
+
+logger = logging.getLogger(__name__)
+
+
+class ClientPool:
+    """Credentials and Google API service objects shared across a process.
+
+    The credentials are loaded (and if necessary refreshed) once, and all token refreshes go through refresh() under
+    a lock, so concurrent callers never refresh or rewrite token.json at the same time. Service objects are not
+    thread-safe, so each thread gets its own Sheets and Drive services, built once from the shared credentials.
+    All of them execute their requests through the same RequestExecutor, so they share one quota budget.
+    """
+
+    def __init__(self, credentials=None, executor=None, build_service=build):
+        """"build_service" is called like googleapiclient.discovery.build to create services; pass
+        gstuff.fake.FakeGoogle.build to work offline."""
+        self.executor = executor if executor is not None else get_executor()
+        self._build_service = build_service
+        self._lock = threading.Lock()
+        self._credentials = credentials
+        self._local = threading.local()
+
+    @property
+    def credentials(self):
+        with self._lock:
+            if self._credentials is None:
+                self._credentials = gdrv.authorize()
+                logger.info('ClientPool authorized')
+            elif not self._credentials.valid:
+                self._refresh()
+            return self._credentials
+
+    def refresh(self):
+        """Refresh the shared credentials and save the new token."""
+        with self._lock:
+            self._refresh()
+
+    def _refresh(self):
+        if not self._credentials.refresh_token:
+            self._credentials = gdrv.authorize()
+            return
+        self._credentials.refresh(Request())
+        gdrv.save_token(self._credentials)
+        logger.info('ClientPool refreshed credentials')
+
+    def _client(self, name, factory):
+        # Reading the credentials refreshes them if needed, before a request made through this client can.
+        credentials = self.credentials
+        clients = getattr(self._local, 'clients', None)
+        if clients is None:
+            clients = self._local.clients = {}
+        client = clients.get(name)
+        if client is None:
+            client = clients[name] = factory(credentials)
+        return client
+
+    def sheets_service(self):
+        return self._client('sheets', lambda creds: self._build_service('sheets', 'v4', credentials=creds, cache_discovery=False))
+
+    def drive_service(self):
+        return self._client('drive', lambda creds: self._build_service('drive', 'v3', credentials=creds, cache_discovery=False))
+
+    def drive(self):
+        """Return this thread's Drive wrapper."""
+        return self._client('Drive', lambda creds: Drive(creds, self.drive_service(), self.executor))
+
+    def gsm(self):
+        """Return this thread's GSManager."""
+        return self._client('GSManager', lambda creds: GSManager(creds, self.sheets_service(), self.drive_service(), self.executor))
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide ClientPool, creating it on first use."""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = ClientPool()
+        return _default_pool
@@ -0,0 +1,338 @@
+from gstuff.vocabulary import MemberStore
+from gstuff.vocabulary import Term
+from gstuff.vocabulary import ValueSet
+from gstuff.vocabulary import VSReference
+from array import array
+import json
+import logging
+import mmap
+import struct
+import sys
+
+
+logger = logging.getLogger(__name__)
+
+
+# A library file holds a corpus of value sets in columns, so it can be memory-mapped and read without parsing:
+#
+#   header      MAGIC, format version, byte order of the arrays and the number of sections
+#   sections    (offset, length) of each section in SECTIONS, then the sections themselves, each 8-byte aligned
+#
+# Strings are stored in dictionaries ('systems', 'codes', 'labels', 'texts' for handles and notes, 'names' for the
+# value set filenames, and 'meta' for a JSON object of each value set's other attributes). A dictionary is a UTF-8
+# blob and an array of the offsets of its strings in it. The members of value set i are rows
+# member_offsets[i]:member_offsets[i + 1] of the member_* columns, which hold dictionary ids, and name_order lists the
+# value sets sorted by name for lookups by binary search.
+
+MAGIC = b'GSTUFFVS'
+VERSION = 1
+HEADER = struct.Struct('<8sIBxxxI')
+SECTION = struct.Struct('<QQ')
+
+DICTIONARIES = ('systems', 'codes', 'labels', 'texts', 'names', 'meta')
+SECTIONS = tuple(f'{name}.{part}' for name in DICTIONARIES for part in ('offsets', 'blob')) + (
+    'member_offsets', 'member_systems', 'member_codes', 'member_labels', 'member_handles', 'member_notes',
+    'name_order')
+# the array type of each section; blobs are bytes
+TYPECODES = dict({f'{name}.offsets': 'Q' for name in DICTIONARIES}, member_offsets='Q', member_systems='I',
+                 member_codes='I', member_labels='I', member_handles='I', member_notes='I', name_order='I')
+
+META_FIELDS = ('label', 'handle', 'kind', 'concept', 'description', 'oid', 'uri', 'namespaces', 'intent',
+               'documentation', 'info', 'errors', 'gs_kind')
+
+
+def vs_name(vs):
+    return vs.info.get('short_name') or vs.label or vs.handle
+
+
+class DictionaryBuilder:
+
+    def __init__(self):
+        self.ids = {}
+        self.offsets = array('Q', [0])
+        self.blob = bytearray()
+
+    def add(self, text):
+        string_id = self.ids.get(text)
+        if string_id is None:
+            string_id = self.ids[text] = len(self.ids)
+            self.blob += text.encode('utf-8')
+            self.offsets.append(len(self.blob))
+        return string_id
+
+    def append(self, text):
+        """ add "text" without de-duplicating it, for strings that are unique anyway """
+        self.blob += text.encode('utf-8')
+        self.offsets.append(len(self.blob))
+        return len(self.offsets) - 2
+
+
+def write_library(path, value_sets):
+    """ write a corpus of value sets to a library file at "path" and return how many were written """
+    dictionaries = {name: DictionaryBuilder() for name in DICTIONARIES}
+    systems, codes, labels, texts = (dictionaries[name] for name in ('systems', 'codes', 'labels', 'texts'))
+    columns = {name: array(TYPECODES[name]) for name in SECTIONS if name.startswith('member_')}
+    columns['member_offsets'].append(0)
+    names = []
+    for vs in value_sets:
+        meta = {name: getattr(vs, name) for name in META_FIELDS}
+        meta['subsets'] = [ref.to_dict() for ref in vs.subsets]
+        members = vs.members if isinstance(vs.members, MemberStore) else MemberStore(vs.members)
+        terms = {}
+        for index, (handle, label, code, system, note, member_terms) in enumerate(members.rows()):
+            columns['member_handles'].append(texts.add(handle))
+            columns['member_labels'].append(labels.add(label))
+            columns['member_codes'].append(codes.add(code))
+            columns['member_systems'].append(systems.add(system))
+            columns['member_notes'].append(texts.add(note))
+            if member_terms:
+                terms[index] = [[term.label, term.context] for term in member_terms]
+        if terms:
+            meta['terms'] = terms
+        columns['member_offsets'].append(len(columns['member_codes']))
+        dictionaries['meta'].append(json.dumps(meta, ensure_ascii=False, separators=(',', ':')))
+        names.append(vs_name(vs))
+        dictionaries['names'].append(names[-1])
+    columns['name_order'] = array('I', sorted(range(len(names)), key=names.__getitem__))
+
+    sections = {}
+    for name, builder in dictionaries.items():
+        sections[f'{name}.offsets'] = builder.offsets.tobytes()
+        sections[f'{name}.blob'] = bytes(builder.blob)
+    for name, column in columns.items():
+        sections[name] = column.tobytes()
+
+    table_end = HEADER.size + SECTION.size * len(SECTIONS)
+    offset = table_end
+    table = []
+    for name in SECTIONS:
+        offset += -offset % 8
+        table.append((offset, len(sections[name])))
+        offset += len(sections[name])
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, sys.byteorder == 'little', len(SECTIONS)))
+        for entry in table:
+            f.write(SECTION.pack(*entry))
+        for name, (offset, _) in zip(SECTIONS, table):
+            f.write(b'\0' * (offset - f.tell()))
+            f.write(sections[name])
+    logger.info(f'Wrote {len(names)} value sets ({len(columns["member_codes"])} members) to {path}')
+    return len(names)
+
+
+class Dictionary:
+    """ a string dictionary in a mapped library file; strings are decoded when they are looked up """
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, string_id):
+        return str(self.blob[self.offsets[string_id]:self.offsets[string_id + 1]], 'utf-8')
+
+
+class Library:
+    """ a memory-mapped library file written by write_library
+
+        Opening a library maps the file and reads its section table; nothing else is read until it is looked up, so
+        only the pages holding the value sets and members that are used are ever loaded.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        self._sections = {}
+        try:
+            self._map_sections()
+        except Exception:
+            self.close()
+            raise
+        self.dictionaries = {name: Dictionary(self._sections[f'{name}.offsets'], self._sections[f'{name}.blob'])
+                             for name in DICTIONARIES}
+        self._systems = {}
+
+    def _map_sections(self):
+        if len(self._view) < HEADER.size:
+            raise ValueError(f'{self.path} is not a value set library')
+        magic, version, little_endian, count = HEADER.unpack_from(self._view)
+        if magic != MAGIC or count != len(SECTIONS):
+            raise ValueError(f'{self.path} is not a value set library')
+        if version != VERSION:
+            raise ValueError(f'{self.path} is version {version} of the library format, not {VERSION}')
+        if bool(little_endian) != (sys.byteorder == 'little'):
+            raise ValueError(f'{self.path} was written on a machine with a different byte order')
+        for i, name in enumerate(SECTIONS):
+            offset, length = SECTION.unpack_from(self._view, HEADER.size + i * SECTION.size)
+            section = self._view[offset:offset + length]
+            if name in TYPECODES:
+                section = section.cast(TYPECODES[name])
+            self._sections[name] = section
+
+    def close(self):
+        # the views have to be released before the map can be closed
+        for section in self._sections.values():
+            section.release()
+        self._sections = {}
+        self.dictionaries = {}
+        self._view.release()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self._sections['name_order'])
+
+    def name(self, index):
+        return self.dictionaries['names'][index]
+
+    def names(self):
+        """ return the names of the value sets, in file order """
+        names = self.dictionaries['names']
+        return [names[i] for i in range(len(self))]
+
+    def index(self, name):
+        """ return the index of the value set called "name" (its filename), or None """
+        order = self._sections['name_order']
+        names = self.dictionaries['names']
+        low, high = 0, len(order)
+        while low < high:
+            middle = (low + high) // 2
+            if names[order[middle]] < name:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(order) and names[order[low]] == name:
+            return order[low]
+        return None
+
+    def _index(self, key):
+        if isinstance(key, str):
+            index = self.index(key)
+            if index is None:
+                raise KeyError(key)
+            return index
+        if not 0 <= key < len(self):
+            raise IndexError('value set index out of range')
+        return key
+
+    def system(self, system_id):
+        # there are few systems and they are read for every member, so they are decoded once
+        system = self._systems.get(system_id)
+        if system is None:
+            system = self._systems[system_id] = sys.intern(self.dictionaries['systems'][system_id])
+        return system
+
+    def meta(self, key):
+        return json.loads(self.dictionaries['meta'][self._index(key)])
+
+    def members(self, key):
+        """ return the members of a value set (by index or name) as a sequence of LibraryMembers """
+        index = self._index(key)
+        offsets = self._sections['member_offsets']
+        return LibraryMembers(self, offsets[index], offsets[index + 1])
+
+    def value_set(self, key):
+        """ return a value set (by index or name) as a ValueSet, with its members in a MemberStore """
+        index = self._index(key)
+        meta = self.meta(index)
+        vs = ValueSet()
+        for name in META_FIELDS:
+            if name in meta:
+                setattr(vs, name, meta[name])
+        vs.subsets = [VSReference(ref['label'], ref['short_name'], ref['note']) for ref in meta.get('subsets', [])]
+        store = vs.members = MemberStore()
+        terms = meta.get('terms', {})
+        texts, labels, codes = (self.dictionaries[name] for name in ('texts', 'labels', 'codes'))
+        columns = self._sections
+        start, end = columns['member_offsets'][index], columns['member_offsets'][index + 1]
+        rows = zip(columns['member_handles'][start:end], columns['member_labels'][start:end],
+                   columns['member_codes'][start:end], columns['member_systems'][start:end],
+                   columns['member_notes'][start:end])
+        for i, (handle, label, code, system, note) in enumerate(rows):
+            member_terms = terms.get(str(i))
+            if member_terms:
+                member_terms = [term_from_pair(pair) for pair in member_terms]
+            store.add(texts[handle], labels[label], codes[code], self.system(system), texts[note], member_terms)
+        return vs
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.value_set(index)
+
+
+def term_from_pair(pair):
+    term = Term()
+    term.label, term.context = pair
+    return term
+
+
+def open_library(path):
+    return Library(path)
+
+
+class LibraryMembers:
+    """ the members of one value set in a Library; items are read from the mapped file when they are accessed """
+
+    def __init__(self, library, start, end):
+        self.library = library
+        self.start = start
+        self.end = end
+
+    def __len__(self):
+        return self.end - self.start
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('member index out of range')
+        return LibraryMember(self.library, self.start + index)
+
+    def __iter__(self):
+        for row in range(self.start, self.end):
+            yield LibraryMember(self.library, row)
+
+    def keys(self):
+        """ return the (system, code) of every member """
+        columns = self.library._sections
+        codes = self.library.dictionaries['codes']
+        system = self.library.system
+        return [(system(columns['member_systems'][row]), codes[columns['member_codes'][row]])
+                for row in range(self.start, self.end)]
+
+
+def _member_column(column, dictionary):
+    def getter(self):
+        library = self.library
+        return library.dictionaries[dictionary][library._sections[column][self.row]]
+    return property(getter)
+
+
+class LibraryMember:
+    """ one member in a Library, read-only, with the attributes of a Concept except terms """
+    __slots__ = ('library', 'row')
+
+    def __init__(self, library, row):
+        self.library = library
+        self.row = row
+
+    handle = _member_column('member_handles', 'texts')
+    label = _member_column('member_labels', 'labels')
+    code = _member_column('member_codes', 'codes')
+    note = _member_column('member_notes', 'texts')
+
+    @property
+    def system(self):
+        return self.library.system(self.library._sections['member_systems'][self.row])
+
+    def __str__(self):
+        return f'{self.system}::{self.code}::{self.label}'
@@ -0,0 +1,132 @@
+from gstuff.vocabulary import Concept
+from gstuff.vocabulary import ValueSet
+from gstuff.vocabulary import VSReference
+
+
+# (row name in the Description sheet, ValueSet attribute) for the single-valued metadata
+METADATA_FIELDS = [
+    ('Label', 'label'),
+    ('Handle', 'handle'),
+    ('Value Set Type', 'kind'),
+    ('Concept', 'concept'),
+    ('Description', 'description'),
+    ('OID', 'oid'),
+    ('URL', 'uri'),
+    ('Intent', 'intent'),
+]
+
+# (row name in the Description sheet, key in ValueSet.documentation) for the repeated metadata
+DOCUMENTATION_FIELDS = [
+    ('Reference', 'references'),
+    ('Note', 'notes'),
+]
+
+
+def member_index(vs: ValueSet) -> dict:
+    """ index the members of a value set by (system, code), in member order; the first member with a key wins """
+    index = {}
+    for concept in vs.members:
+        key = concept.system, concept.code
+        if key not in index:
+            index[key] = concept
+    return index
+
+
+def subset_index(vs: ValueSet) -> dict:
+    """ index the subsets of a grouping value set by filename; the first reference to a file wins """
+    index = {}
+    for ref in vs.subsets:
+        index.setdefault(ref.short_name, ref)
+    return index
+
+
+class ValueSetDiff:
+    """ the differences between an old and a new version of a value set """
+
+    def __init__(self, old: ValueSet, new: ValueSet):
+        self.old = old
+        self.new = new
+        self.added: list[Concept] = []
+        self.removed: list[Concept] = []
+        self.relabeled: list[tuple[Concept, Concept]] = []
+        self.metadata: list[tuple[str, object, object]] = []
+        self.subsets_added: list[VSReference] = []
+        self.subsets_removed: list[VSReference] = []
+        self.subsets_relabeled: list[tuple[VSReference, VSReference]] = []
+
+    @property
+    def identical(self):
+        return not (self.added or self.removed or self.relabeled or self.metadata or self.subsets_added
+                    or self.subsets_removed or self.subsets_relabeled)
+
+    def report(self):
+        """ return the differences as lines of text """
+        lines = []
+        for name, old_value, new_value in self.metadata:
+            lines.append(f'{name}: {old_value!r} -> {new_value!r}')
+        for concept in self.added:
+            lines.append(f'+ {concept}')
+        for concept in self.removed:
+            lines.append(f'- {concept}')
+        for old_concept, new_concept in self.relabeled:
+            lines.append(f'~ {old_concept.system}::{old_concept.code}: {old_concept.label!r} -> {new_concept.label!r}')
+        for ref in self.subsets_added:
+            lines.append(f'+ subset {ref.short_name} ({ref.label})')
+        for ref in self.subsets_removed:
+            lines.append(f'- subset {ref.short_name} ({ref.label})')
+        for old_ref, new_ref in self.subsets_relabeled:
+            lines.append(f'~ subset {old_ref.short_name}: {old_ref.label!r} -> {new_ref.label!r}')
+        return lines
+
+    def __str__(self):
+        return '\n'.join(self.report()) if not self.identical else 'No differences.'
+
+
+def compare_metadata(old: ValueSet, new: ValueSet):
+    """ return (name, old value, new value) for each item of Description metadata that differs """
+    rv = []
+    for name, attr in METADATA_FIELDS:
+        old_value = getattr(old, attr)
+        new_value = getattr(new, attr)
+        if old_value != new_value:
+            rv.append((name, old_value, new_value))
+    for name, key in DOCUMENTATION_FIELDS:
+        old_value = old.documentation.get(key, [])
+        new_value = new.documentation.get(key, [])
+        if old_value != new_value:
+            rv.append((name, old_value, new_value))
+    return rv
+
+
+def compare_value_sets(old: ValueSet, new: ValueSet) -> ValueSetDiff:
+    """ compare two value sets, matching members on (system, code) and subsets on filename
+
+        Both sides are indexed once in dicts, so the comparison takes time proportional to the number of members.
+        Added members are listed in the order of the new value set, removed and relabeled ones in the order of the
+        old one.
+    """
+    diff = ValueSetDiff(old, new)
+    diff.metadata = compare_metadata(old, new)
+
+    old_index = member_index(old)
+    new_index = member_index(new)
+    diff.added = [concept for key, concept in new_index.items() if key not in old_index]
+    for key, concept in old_index.items():
+        new_concept = new_index.get(key)
+        if new_concept is None:
+            diff.removed.append(concept)
+        elif new_concept.label != concept.label:
+            diff.relabeled.append((concept, new_concept))
+
+    old_subsets = subset_index(old)
+    new_subsets = subset_index(new)
+    for short_name, ref in new_subsets.items():
+        if short_name not in old_subsets:
+            diff.subsets_added.append(ref)
+    for short_name, ref in old_subsets.items():
+        new_ref = new_subsets.get(short_name)
+        if new_ref is None:
+            diff.subsets_removed.append(ref)
+        elif new_ref.label != ref.label:
+            diff.subsets_relabeled.append((ref, new_ref))
+    return diff
@@ -0,0 +1,216 @@
+from googleapiclient.errors import HttpError
+import logging
+import random
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+# Requests per minute allowed for each (api, kind). These match the default per-user quotas of the Sheets API (60
+# read and 60 write requests per minute) and stay below the Drive API's per-user query and sustained write limits.
+DEFAULT_QUOTAS = {
+    ('sheets', 'read'): 60,
+    ('sheets', 'write'): 60,
+    ('drive', 'read'): 1000,
+    ('drive', 'write'): 180,
+}
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# The most requests the Drive API accepts in one batch HTTP request.
+BATCH_MAX_REQUESTS = 100
+RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+
+
+def is_retryable(error, idempotent=True):
+    """Return True if the HttpError "error" is a rate limit or server error worth retrying.
+
+    A request that is not idempotent (e.g. one that creates a file) is only retried after a rate limit error, which
+    means it was refused. After a server error it may still have succeeded, and sending it again could do it twice."""
+    status = int(getattr(error.resp, 'status', 0) or 0)
+    if status == 429:
+        return True
+    if status in RETRY_STATUSES:
+        return idempotent
+    # The Drive API reports rate limits as 403 errors with a rate limit reason.
+    if status == 403:
+        content = error.content.decode('utf-8', 'replace') if isinstance(error.content, bytes) else str(error.content)
+        return any(reason in content for reason in RATE_LIMIT_REASONS)
+    return False
+
+
+class TokenBucket:
+    """A thread-safe token bucket that allows "per_minute" requests per minute, with bursts of up to "capacity"."""
+
+    def __init__(self, per_minute, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.tokens = float(self.capacity)
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens=1):
+        """Take "tokens" tokens, waiting until they are available. Return the number of seconds waited.
+
+        Taking more tokens than the capacity (e.g. for a batch request) waits for a full bucket and leaves it in debt,
+        so the requests that follow wait for the rest."""
+        needed = min(tokens, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                # Allow for rounding, or a wait of a fraction of a microsecond could repeat forever.
+                if self.tokens >= needed - 1e-9:
+                    self.tokens = max(0.0, self.tokens - needed) - (tokens - needed)
+                    return waited
+                delay = (needed - self.tokens) / self.rate
+            self._sleep(delay)
+            waited += delay
+
+    def drain(self):
+        """Empty the bucket, e.g. after the server reported that the quota was exceeded."""
+        with self._lock:
+            self._refill()
+            self.tokens = 0.0
+
+
+class RequestExecutor:
+    """Executes Google API requests under client-side rate limits, retrying rate limit and server errors with
+    jittered exponential backoff.
+
+    Every request is classified by api ('sheets' or 'drive') and kind ('read' or 'write'), and takes a token from
+    the matching bucket before it is sent. Counters of calls, retries, failures and time spent waiting are kept for
+    each (api, kind) in "stats".
+    """
+
+    def __init__(self, quotas=None, max_retries=6, base_delay=1.0, max_delay=64.0, burst=0.1, clock=time.monotonic,
+                 sleep=time.sleep):
+        """"burst" is the fraction of a minute's quota that may be sent at once. Quotas are enforced per minute, so a
+        full minute's burst followed by the sustained rate would exceed them."""
+        self.quotas = dict(DEFAULT_QUOTAS)
+        if quotas:
+            self.quotas.update(quotas)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.clock = clock
+        self.sleep = sleep
+        self.buckets = {key: TokenBucket(per_minute, max(1, int(per_minute * burst)), clock=clock, sleep=sleep)
+                        for key, per_minute in self.quotas.items()}
+        self.stats = {key: {'calls': 0, 'retries': 0, 'failures': 0, 'waited': 0.0} for key in self.quotas}
+        self._lock = threading.Lock()
+
+    def _count(self, key, name, amount=1):
+        with self._lock:
+            self.stats[key][name] += amount
+
+    def backoff(self, attempt):
+        """Return the delay before retry number "attempt" (0-based): exponential, capped, with full jitter."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def wait(self, api, kind, cost=1):
+        """Take "cost" tokens from the bucket for (api, kind)."""
+        key = (api, kind)
+        waited = self.buckets[key].acquire(cost)
+        self._count(key, 'calls', cost)
+        if waited:
+            self._count(key, 'waited', waited)
+
+    def retry_or_raise(self, api, kind, error, attempt, idempotent=True):
+        """Sleep before retrying after "error" on attempt "attempt", or re-raise it if it should not be retried."""
+        key = (api, kind)
+        if not is_retryable(error, idempotent) or attempt >= self.max_retries:
+            self._count(key, 'failures')
+            raise error
+        self._count(key, 'retries')
+        self.buckets[key].drain()
+        delay = self.backoff(attempt)
+        logger.warning(f'{api} {kind} request failed ({error.resp.status}), retrying in {delay:.1f}s')
+        self.sleep(delay)
+        self._count(key, 'waited', delay)
+
+    def execute(self, request, api='sheets', kind='read', cost=1, idempotent=True):
+        """Execute "request" (anything with an execute() method) and return its result. Pass idempotent=False for a
+        request that must not be sent twice, such as a create; it is then only retried after rate limit errors."""
+        attempt = 0
+        while True:
+            self.wait(api, kind, cost)
+            try:
+                return request.execute()
+            except HttpError as error:
+                self.retry_or_raise(api, kind, error, attempt, idempotent)
+                attempt += 1
+
+    def execute_batch(self, new_batch, requests, api='drive', kind='read', batch_size=BATCH_MAX_REQUESTS):
+        """Execute {key: request} as batch HTTP requests of up to "batch_size" requests each and return (results,
+        errors), {key: response} and {key: HttpError}.
+
+        "new_batch" is the service's new_batch_http_request. Each request in a batch takes a token, as each counts
+        against the quota. Requests that fail with a retryable error are sent again in a later batch, after the
+        same backoff as execute() uses, until they succeed or max_retries is reached.
+        """
+        results = {}
+        errors = {}
+        pending = list(requests.items())
+        attempt = 0
+        key = (api, kind)
+        while pending:
+            failed = []
+            for start in range(0, len(pending), batch_size):
+                chunk = pending[start:start + batch_size]
+                responses = {}
+
+                def callback(request_id, response, exception):
+                    responses[request_id] = (response, exception)
+
+                batch = new_batch(callback=callback)
+                for index, (_, request) in enumerate(chunk):
+                    batch.add(request, request_id=str(index))
+                self.execute(batch, api, kind, cost=len(chunk))
+                for index, item in enumerate(chunk):
+                    response, exception = responses.get(str(index), (None, None))
+                    if exception is None:
+                        results[item[0]] = response
+                    elif is_retryable(exception) and attempt < self.max_retries:
+                        failed.append(item)
+                    else:
+                        self._count(key, 'failures')
+                        errors[item[0]] = exception
+            pending = failed
+            if pending:
+                self._count(key, 'retries', len(pending))
+                self.buckets[key].drain()
+                delay = self.backoff(attempt)
+                logger.warning(f'{len(pending)} {api} {kind} requests in a batch failed, retrying in {delay:.1f}s')
+                self.sleep(delay)
+                self._count(key, 'waited', delay)
+                attempt += 1
+        return results, errors
+
+    def summary(self):
+        lines = []
+        for (api, kind), stats in sorted(self.stats.items()):
+            lines.append(f"{api} {kind}: {stats['calls']} calls, {stats['retries']} retries, "
+                         f"{stats['failures']} failures, {stats['waited']:.1f}s waiting")
+        return '\n'.join(lines)
+
+
+_default_executor = None
+_default_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the process-wide RequestExecutor, creating it on first use."""
+    global _default_executor
+    with _default_executor_lock:
+        if _default_executor is None:
+            _default_executor = RequestExecutor()
+        return _default_executor
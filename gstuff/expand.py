@@ -0,0 +1,188 @@
+from concurrent.futures import ThreadPoolExecutor
+from gstuff.clients import get_pool
+from gstuff.vocabulary import ValueSet
+from gstuff.vocabulary import value_set_from_gs
+import logging
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+
+def build_name_index(drive, folder_ids):
+    """ return {file name: file id} for the files in the given folders; the first file with a name wins """
+    index = {}
+    for folder_id in folder_ids:
+        for item in drive.list_from_query(f"'{folder_id}' in parents and trashed = false"):
+            if item['name'] in index:
+                if index[item['name']] != item['id']:
+                    logger.warning(f"More than one file is called {item['name']}, using {index[item['name']]}")
+                continue
+            index[item['name']] = item['id']
+    return index
+
+
+class Expansion:
+    """ the flattened membership of a value set: every member of it and of its subsets, recursively, once each
+
+        "members" maps (system, code) to the first Concept found for it, in the order they were found, and
+        "sources" maps (system, code) to the names of the value sets that list that member directly.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.members = {}
+        self.sources = {}
+        self.errors = []
+
+    def add(self, concept, source):
+        key = concept.system, concept.code
+        if key not in self.members:
+            self.members[key] = concept
+            self.sources[key] = [source]
+        elif source not in self.sources[key]:
+            self.sources[key].append(source)
+
+    def update(self, other):
+        for key, concept in other.members.items():
+            if key not in self.members:
+                self.members[key] = concept
+                self.sources[key] = list(other.sources[key])
+            else:
+                sources = self.sources[key]
+                sources.extend(source for source in other.sources[key] if source not in sources)
+        self.errors.extend(error for error in other.errors if error not in self.errors)
+
+    def __len__(self):
+        return len(self.members)
+
+    def value_set(self):
+        """ return the expansion as an extensional ValueSet """
+        vs = ValueSet()
+        vs.label = self.name
+        vs.kind = 'extensional'
+        vs.info['short_name'] = self.name
+        vs.members = list(self.members.values())
+        vs.errors = list(self.errors)
+        return vs
+
+
+class Expander:
+    """ expands grouping value sets into the union of the members of their subsets
+
+        Subsets are found by name (VSReference.short_name) in "index", {file name: file id}, or if it is not given
+        in an index of the value set folders "folder_ids" on Drive (e.g. the staging and intensional folders). Each value
+        set is loaded once, with the subsets at each level of the hierarchy loaded concurrently, and each value set is
+        expanded once, so subsets shared by several groupings are only loaded and expanded once. A subset that
+        contains itself, directly or through other subsets, is reported in the expansion's errors.
+    """
+
+    def __init__(self, pool=None, folder_ids=(), index=None, cache=None, workers=8):
+        self.pool = pool or get_pool()
+        self.folder_ids = folder_ids
+        self.cache = cache
+        self.workers = workers
+        self._index = index
+        self._lock = threading.Lock()
+        self._loads = {}
+        self._expansions = {}
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='expand')
+
+    @property
+    def index(self):
+        with self._lock:
+            if self._index is None:
+                self._index = build_name_index(self.pool.drive(), self.folder_ids)
+                logger.info(f'Indexed {len(self._index)} value set files')
+            return self._index
+
+    def close(self):
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _load(self, name):
+        file_id = self.index.get(name)
+        if file_id is None:
+            return None
+        gsm = self.pool.gsm()
+        wb = gsm.get_workbook(file_id, bulk=True, cache=self.cache)
+        if not wb.name:
+            return None
+        return value_set_from_gs(wb)
+
+    def load(self, name):
+        """ return a future for the value set called "name", or for None if there is no such file """
+        with self._lock:
+            future = self._loads.get(name)
+            if future is None:
+                future = self._loads[name] = self._executor.submit(self._load, name)
+            return future
+
+    def add(self, vs):
+        """ add an already loaded value set, e.g. the one being expanded """
+        with self._lock:
+            future = self._loads.get(vs.info['short_name'])
+            if future is None:
+                future = self._loads[vs.info['short_name']] = self._executor.submit(lambda: vs)
+        return future
+
+    def load_all(self, names):
+        """ load the value sets called "names" and all of their subsets, a level of the hierarchy at a time """
+        seen = set()
+        level = [name for name in names if name]
+        while level:
+            seen.update(level)
+            futures = [self.load(name) for name in level]
+            level = []
+            for future in futures:
+                vs = future.result()
+                if vs is None:
+                    continue
+                for ref in vs.subsets:
+                    if ref.short_name and ref.short_name not in seen:
+                        seen.add(ref.short_name)
+                        level.append(ref.short_name)
+
+    def expand(self, vs_or_name):
+        """ return the Expansion of a ValueSet or of the value set file with the given name """
+        if isinstance(vs_or_name, ValueSet):
+            name = vs_or_name.info['short_name']
+            self.add(vs_or_name)
+        else:
+            name = vs_or_name
+        self.load_all([name])
+        return self._expand(name, [])
+
+    def _expand(self, name, path):
+        with self._lock:
+            expansion = self._expansions.get(name)
+        if expansion is not None:
+            return expansion
+        expansion = Expansion(name)
+        vs = self.load(name).result()
+        if vs is None:
+            expansion.errors.append(f'Value set not found: {name}')
+        else:
+            expansion.errors.extend(vs.errors)
+            for concept in vs.members:
+                expansion.add(concept, name)
+            path = path + [name]
+            for ref in vs.subsets:
+                if not ref.short_name:
+                    expansion.errors.append(f'Subset without a filename in {name}: {ref.label}')
+                    continue
+                if ref.short_name in path:
+                    cycle = ' -> '.join(path[path.index(ref.short_name):] + [ref.short_name])
+                    expansion.errors.append(f'Subset cycle: {cycle}')
+                    continue
+                expansion.update(self._expand(ref.short_name, path))
+        # an expansion that met a cycle depends on where the cycle was entered, so only complete ones are reused
+        if not any(error.startswith('Subset cycle') for error in expansion.errors):
+            with self._lock:
+                self._expansions[name] = expansion
+        return expansion
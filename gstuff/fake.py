@@ -0,0 +1,558 @@
+"""An in-process stand-in for the Sheets v4 and Drive v3 services.
+
+FakeGoogle holds the spreadsheets and Drive files, and its sheets_service() and drive_service() objects can be passed
+to GSManager, Workbook and Drive (or its build method to ClientPool) in place of googleapiclient's build(...). Calls
+advance a simulated clock by a configurable latency, per-minute quotas are enforced with 429 errors like the real
+services, and the number of calls and bytes sent and received are counted.
+"""
+from googleapiclient.errors import HttpError
+import httplib2
+import itertools
+import json
+import re
+import threading
+
+
+SPREADSHEET_MIME_TYPE = 'application/vnd.google-apps.spreadsheet'
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+
+# Requests per minute allowed by the fake services, like the default per-user quotas of the real ones.
+DEFAULT_QUOTAS = {
+    ('sheets', 'read'): 60,
+    ('sheets', 'write'): 60,
+    ('drive', 'read'): 12000,
+    ('drive', 'write'): 12000,
+}
+
+
+class SimClock:
+    """A simulated clock. sleep() advances it instead of blocking."""
+
+    def __init__(self, start=0.0):
+        self._now = start
+        self._lock = threading.Lock()
+
+    def now(self):
+        with self._lock:
+            return self._now
+
+    def sleep(self, seconds):
+        self.advance(seconds)
+
+    def advance(self, seconds):
+        with self._lock:
+            self._now += max(0.0, seconds)
+
+
+def column_index(letters):
+    index = 0
+    for c in letters.upper():
+        index = index * 26 + ord(c) - ord('A') + 1
+    return index - 1
+
+
+def parse_a1(a1_range):
+    """Split an A1 range into (sheet title, first row, first column, last row, last column), all 0-based and
+    inclusive, with None for unbounded ends."""
+    match = re.fullmatch(r"(?:'((?:[^']|'')*)'|([^!]*?))(?:!(.*))?", a1_range)
+    title = match.group(1).replace("''", "'") if match.group(1) is not None else match.group(2)
+    cells = match.group(3)
+    if not cells:
+        return title, 0, 0, None, None
+    bounds = []
+    for cell in cells.split(':'):
+        cell_match = re.fullmatch(r'([A-Za-z]*)(\d*)', cell)
+        col = column_index(cell_match.group(1)) if cell_match.group(1) else None
+        row = int(cell_match.group(2)) - 1 if cell_match.group(2) else None
+        bounds.append((row, col))
+    (r0, c0), (r1, c1) = bounds[0], bounds[-1]
+    if len(bounds) == 1:
+        r1, c1 = r0, c0
+    return title, r0 or 0, c0 or 0, r1, c1
+
+
+def http_error(status, message, uri='fake'):
+    content = json.dumps({'error': {'code': status, 'message': message}}).encode('utf-8')
+    return HttpError(httplib2.Response({'status': status}), content, uri=uri)
+
+
+def cell_value(cell):
+    value = cell.get('userEnteredValue', {})
+    for key in ('stringValue', 'numberValue', 'boolValue', 'formulaValue'):
+        if key in value:
+            return value[key] if key != 'numberValue' else str(value[key])
+    return ''
+
+
+def trim_row(row):
+    while row and row[-1] in ('', None):
+        row.pop()
+    return row
+
+
+class FakeCredentials:
+    """Credentials that are always valid, for use with a ClientPool built on FakeGoogle."""
+
+    valid = True
+    expired = False
+    refresh_token = None
+
+    def to_json(self):
+        return '{}'
+
+
+class FakeRequest:
+
+    def __init__(self, google, api, kind, method, call, body=None, cost=1):
+        self.google = google
+        self.api = api
+        self.kind = kind
+        self.method = method
+        self.call = call
+        self.body = body
+        # the number of requests counted against the quota
+        self.cost = cost
+
+    def execute(self, num_retries=0):
+        return self.google.perform(self)
+
+
+class FakeGoogle:
+    """The state and accounting shared by the fake Sheets and Drive services."""
+
+    def __init__(self, latency=0.2, bytes_per_second=2000000, quotas=None, clock=None):
+        self.latency = latency
+        self.bytes_per_second = bytes_per_second
+        self.quotas = dict(DEFAULT_QUOTAS)
+        if quotas:
+            self.quotas.update(quotas)
+        self.clock = clock if clock is not None else SimClock()
+        self.files = {}
+        self.calls = {}
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.errors = 0
+        self._windows = {}
+        self._ids = itertools.count(1)
+        # the ids of the files changed, in order, for the changes feed; a page token is a position in it
+        self.change_log = []
+        self._lock = threading.RLock()
+
+    # Accounting
+
+    @property
+    def total_calls(self):
+        return sum(self.calls.values())
+
+    def reset_counters(self):
+        with self._lock:
+            self.calls = {}
+            self.bytes_sent = 0
+            self.bytes_received = 0
+            self.errors = 0
+
+    def perform(self, request):
+        with self._lock:
+            key = (request.api, request.kind)
+            window = int(self.clock.now() // 60)
+            used = self._windows.get(key)
+            if used is None or used[0] != window:
+                used = [window, 0]
+                self._windows[key] = used
+            self.calls[(request.api, request.method)] = self.calls.get((request.api, request.method), 0) + 1
+            sent = len(json.dumps(request.body)) if request.body is not None else 0
+            self.bytes_sent += sent
+            if used[1] + request.cost > self.quotas[key]:
+                self.errors += 1
+                self.clock.advance(self.latency)
+                raise http_error(429, f'Quota exceeded for {request.api} {request.kind} requests per minute')
+            used[1] += request.cost
+            received = 0
+            try:
+                result = request.call()
+                received = len(json.dumps(result))
+                self.bytes_received += received
+                return result
+            except HttpError:
+                self.errors += 1
+                raise
+            finally:
+                self.clock.advance(self.latency + (sent + received) / self.bytes_per_second)
+
+    def summary(self):
+        lines = [f'{self.total_calls} calls, {self.errors} errors, {self.bytes_sent} bytes sent, '
+                 f'{self.bytes_received} bytes received, {self.clock.now():.1f}s simulated']
+        for (api, method), count in sorted(self.calls.items()):
+            lines.append(f'  {api}.{method}: {count}')
+        return '\n'.join(lines)
+
+    # Services
+
+    def sheets_service(self):
+        return FakeSheetsService(self)
+
+    def drive_service(self):
+        return FakeDriveService(self)
+
+    def build(self, name, version, credentials=None, **kwargs):
+        """A drop-in replacement for googleapiclient.discovery.build."""
+        if name == 'sheets':
+            return self.sheets_service()
+        if name == 'drive':
+            return self.drive_service()
+        raise ValueError(f'Unknown service: {name}')
+
+    # State
+
+    def new_id(self, prefix):
+        return f'{prefix}{next(self._ids):06d}'
+
+    def add_file(self, name, mime_type, parents=None, file_id=None):
+        with self._lock:
+            file_id = file_id or self.new_id('file')
+            self.files[file_id] = {
+                'id': file_id,
+                'name': name,
+                'mimeType': mime_type,
+                'parents': list(parents or ['root']),
+                'trashed': False,
+                'version': 1,
+                'modifiedTime': self.clock.now(),
+                'sheets': [],
+            }
+            self.change_log.append(file_id)
+            return self.files[file_id]
+
+    def add_folder(self, name, parents=None, file_id=None):
+        return self.add_file(name, FOLDER_MIME_TYPE, parents, file_id)['id']
+
+    def add_spreadsheet(self, name, sheets, parents=None, file_id=None):
+        """Add a spreadsheet with the given {title: values} sheets and return its id."""
+        file = self.add_file(name, SPREADSHEET_MIME_TYPE, parents, file_id)
+        for title, values in sheets.items():
+            self._add_sheet(file, title, [list(row) for row in values])
+        return file['id']
+
+    def _add_sheet(self, file, title, values=None, grid=None):
+        values = values or []
+        grid = dict(grid or {})
+        grid.setdefault('rowCount', max(len(values), 1000))
+        grid.setdefault('columnCount', max([len(row) for row in values] + [26]))
+        sheet_id = len(file['sheets'])
+        file['sheets'].append({
+            'properties': {'sheetId': sheet_id, 'title': title, 'index': sheet_id, 'gridProperties': grid},
+            'values': values,
+        })
+        return sheet_id
+
+    def touch(self, file):
+        file['version'] += 1
+        file['modifiedTime'] = self.clock.now()
+        self.change_log.append(file['id'])
+
+    def file(self, file_id):
+        file = self.files.get(file_id)
+        if file is None:
+            raise http_error(404, f'File not found: {file_id}')
+        return file
+
+    def sheet(self, file, title):
+        for sheet in file['sheets']:
+            if sheet['properties']['title'] == title:
+                return sheet
+        raise http_error(400, f'Unable to parse range: {title}')
+
+    def read_range(self, file_id, a1_range):
+        title, r0, c0, r1, c1 = parse_a1(a1_range)
+        values = self.sheet(self.file(file_id), title)['values']
+        rows = values[r0:None if r1 is None else r1 + 1]
+        rows = [trim_row(list(row[c0:None if c1 is None else c1 + 1])) for row in rows]
+        while rows and not rows[-1]:
+            rows.pop()
+        value_range = {'range': a1_range, 'majorDimension': 'ROWS'}
+        if rows:
+            value_range['values'] = rows
+        return value_range
+
+    def write_range(self, file_id, a1_range, rows):
+        title, r0, c0, _, _ = parse_a1(a1_range)
+        file = self.file(file_id)
+        values = self.sheet(file, title)['values']
+        for i, row in enumerate(rows):
+            while len(values) <= r0 + i:
+                values.append([])
+            target = values[r0 + i]
+            for j, value in enumerate(row):
+                while len(target) <= c0 + j:
+                    target.append('')
+                target[c0 + j] = '' if value is None else str(value)
+        self.touch(file)
+        cells = sum(len(row) for row in rows)
+        return {'spreadsheetId': file_id, 'updatedRange': a1_range, 'updatedRows': len(rows), 'updatedCells': cells}
+
+    def clear_range(self, file_id, a1_range):
+        title, r0, c0, r1, c1 = parse_a1(a1_range)
+        file = self.file(file_id)
+        values = self.sheet(file, title)['values']
+        for r in range(r0, len(values) if r1 is None else min(r1 + 1, len(values))):
+            row = values[r]
+            for c in range(c0, len(row) if c1 is None else min(c1 + 1, len(row))):
+                row[c] = ''
+            trim_row(row)
+        while values and not values[-1]:
+            values.pop()
+        self.touch(file)
+        return {'spreadsheetId': file_id, 'clearedRange': a1_range}
+
+
+class _Resource:
+
+    def __init__(self, google):
+        self.google = google
+
+    def _request(self, api, kind, method, call, body=None):
+        return FakeRequest(self.google, api, kind, method, call, body)
+
+
+class FakeSheetsService(_Resource):
+
+    def spreadsheets(self):
+        return _Spreadsheets(self.google)
+
+
+class _Spreadsheets(_Resource):
+
+    def values(self):
+        return _Values(self.google)
+
+    def get(self, spreadsheetId, fields=None, ranges=None, includeGridData=False):
+        def call():
+            file = self.google.file(spreadsheetId)
+            return {
+                'spreadsheetId': spreadsheetId,
+                'properties': {'title': file['name']},
+                'sheets': [{'properties': dict(sheet['properties'])} for sheet in file['sheets']],
+            }
+        return self._request('sheets', 'read', 'spreadsheets.get', call)
+
+    def create(self, body, fields=None):
+        def call():
+            file = self.google.add_file(body.get('properties', {}).get('title', 'Untitled spreadsheet'),
+                                        SPREADSHEET_MIME_TYPE)
+            sheets = body.get('sheets') or [{'properties': {'title': 'Sheet1'}}]
+            for sheet in sheets:
+                properties = sheet.get('properties', {})
+                values = []
+                for data in sheet.get('data', []):
+                    for row in data.get('rowData', []):
+                        values.append(trim_row([cell_value(cell) for cell in row.get('values', [])]))
+                self.google._add_sheet(file, properties.get('title', f"Sheet{len(file['sheets']) + 1}"), values,
+                                       properties.get('gridProperties'))
+            return {'spreadsheetId': file['id'], 'properties': {'title': file['name']}}
+        return self._request('sheets', 'write', 'spreadsheets.create', call, body)
+
+    def batchUpdate(self, spreadsheetId, body):
+        def call():
+            file = self.google.file(spreadsheetId)
+            replies = []
+            for request in body.get('requests', []):
+                if 'addSheet' in request:
+                    properties = request['addSheet'].get('properties', {})
+                    sheet_id = self.google._add_sheet(file, properties.get('title'), [],
+                                                      properties.get('gridProperties'))
+                    replies.append({'addSheet': {'properties': file['sheets'][sheet_id]['properties']}})
+                else:
+                    replies.append({})
+            self.google.touch(file)
+            return {'spreadsheetId': spreadsheetId, 'replies': replies}
+        return self._request('sheets', 'write', 'spreadsheets.batchUpdate', call, body)
+
+
+class _Values(_Resource):
+
+    def get(self, spreadsheetId, range, **kwargs):
+        return self._request('sheets', 'read', 'values.get', lambda: self.google.read_range(spreadsheetId, range))
+
+    def batchGet(self, spreadsheetId, ranges, **kwargs):
+        def call():
+            return {
+                'spreadsheetId': spreadsheetId,
+                'valueRanges': [self.google.read_range(spreadsheetId, a1_range) for a1_range in ranges],
+            }
+        return self._request('sheets', 'read', 'values.batchGet', call)
+
+    def update(self, spreadsheetId, range, body, valueInputOption='RAW', **kwargs):
+        def call():
+            return self.google.write_range(spreadsheetId, range, body.get('values', []))
+        return self._request('sheets', 'write', 'values.update', call, body)
+
+    def batchUpdate(self, spreadsheetId, body):
+        def call():
+            responses = [self.google.write_range(spreadsheetId, data['range'], data.get('values', []))
+                         for data in body.get('data', [])]
+            return {'spreadsheetId': spreadsheetId, 'responses': responses}
+        return self._request('sheets', 'write', 'values.batchUpdate', call, body)
+
+    def clear(self, spreadsheetId, range, body=None):
+        return self._request('sheets', 'write', 'values.clear', lambda: self.google.clear_range(spreadsheetId, range))
+
+    def batchClear(self, spreadsheetId, body):
+        def call():
+            cleared = [self.google.clear_range(spreadsheetId, a1_range)['clearedRange']
+                       for a1_range in body.get('ranges', [])]
+            return {'spreadsheetId': spreadsheetId, 'clearedRanges': cleared}
+        return self._request('sheets', 'write', 'values.batchClear', call, body)
+
+
+class FakeDriveService(_Resource):
+
+    def files(self):
+        return _Files(self.google)
+
+    def changes(self):
+        return _Changes(self.google)
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(self.google, callback)
+
+
+class FakeBatch:
+    """A batch HTTP request: one call that carries several requests, each of which counts against the quota. As with
+    googleapiclient's BatchHttpRequest, each response or HttpError is passed to the callback, not raised."""
+
+    def __init__(self, google, callback=None):
+        self.google = google
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        request_id = request_id if request_id is not None else str(len(self.requests) + 1)
+        self.requests.append((request_id, request, callback or self.callback))
+
+    def execute(self, num_retries=0):
+        def call():
+            responses = []
+            for request_id, request, callback in self.requests:
+                try:
+                    response, exception = request.call(), None
+                except HttpError as error:
+                    self.google.errors += 1
+                    response, exception = None, error
+                responses.append(response)
+                if callback:
+                    callback(request_id, response, exception)
+            return responses
+        body = [request.body for _, request, _ in self.requests]
+        kind = 'write' if any(request.kind == 'write' for _, request, _ in self.requests) else 'read'
+        return self.google.perform(FakeRequest(self.google, 'drive', kind, 'batch', call, body, len(self.requests)))
+
+
+def drive_file(file):
+    return {key: value for key, value in file.items() if key != 'sheets'}
+
+
+def matches_query(file, query):
+    """Evaluate the subset of the Drive query language used in this package: clauses joined with "and" of the
+    forms "'<id>' in parents", "name = '<name>'", "mimeType = '<type>'" and "trashed = true|false"."""
+    if not query:
+        return not file['trashed']
+    for clause in re.split(r'\s+and\s+', query.strip()):
+        clause = clause.strip()
+        match = re.fullmatch(r"'([^']*)' in parents", clause)
+        if match:
+            if match.group(1) not in file['parents']:
+                return False
+            continue
+        match = re.fullmatch(r"(name|mimeType)\s*(=|!=)\s*'((?:[^'\\]|\\.)*)'", clause)
+        if match:
+            value = match.group(3).replace("\\'", "'")
+            if (file[match.group(1)] == value) != (match.group(2) == '='):
+                return False
+            continue
+        match = re.fullmatch(r'trashed\s*=\s*(true|false)', clause)
+        if match:
+            if file['trashed'] != (match.group(1) == 'true'):
+                return False
+            continue
+        raise http_error(400, f'Invalid query: {query}')
+    return True
+
+
+class _Files(_Resource):
+
+    def get(self, fileId, fields=None, **kwargs):
+        return self._request('drive', 'read', 'files.get', lambda: drive_file(self.google.file(fileId)))
+
+    def list(self, q=None, spaces=None, fields=None, pageSize=100, pageToken=None, **kwargs):
+        def call():
+            matching = [drive_file(file) for file in self.google.files.values() if matches_query(file, q)]
+            start = int(pageToken or 0)
+            end = start + min(pageSize or 100, 1000)
+            result = {'files': matching[start:end]}
+            if end < len(matching):
+                result['nextPageToken'] = str(end)
+            return result
+        return self._request('drive', 'read', 'files.list', call)
+
+    def create(self, body=None, fields=None, **kwargs):
+        def call():
+            body_ = body or {}
+            file = self.google.add_file(body_.get('name', 'Untitled'), body_.get('mimeType', ''),
+                                        body_.get('parents'))
+            if file['mimeType'] == SPREADSHEET_MIME_TYPE:
+                self.google._add_sheet(file, 'Sheet1')
+            return drive_file(file)
+        return self._request('drive', 'write', 'files.create', call, body)
+
+    def update(self, fileId, body=None, addParents=None, removeParents=None, fields=None, **kwargs):
+        def call():
+            file = self.google.file(fileId)
+            parents = file['parents']
+            for parent in (removeParents or '').split(','):
+                if parent in parents:
+                    parents.remove(parent)
+            for parent in (addParents or '').split(','):
+                if parent and parent not in parents:
+                    parents.append(parent)
+            for key, value in (body or {}).items():
+                if key in ('name', 'trashed', 'mimeType'):
+                    file[key] = value
+            self.google.touch(file)
+            return drive_file(file)
+        return self._request('drive', 'write', 'files.update', call, body)
+
+    def delete(self, fileId, **kwargs):
+        def call():
+            self.google.file(fileId)
+            del self.google.files[fileId]
+            self.google.change_log.append(fileId)
+            return {}
+        return self._request('drive', 'write', 'files.delete', call)
+
+
+class _Changes(_Resource):
+
+    def getStartPageToken(self, **kwargs):
+        return self._request('drive', 'read', 'changes.getStartPageToken',
+                             lambda: {'startPageToken': str(len(self.google.change_log))})
+
+    def list(self, pageToken, spaces=None, includeRemoved=True, fields=None, pageSize=100, **kwargs):
+        def call():
+            log = self.google.change_log
+            start = int(pageToken)
+            end = min(start + min(pageSize or 100, 1000), len(log))
+            changes = []
+            for file_id in log[start:end]:
+                file = self.google.files.get(file_id)
+                if file is None:
+                    if includeRemoved:
+                        changes.append({'fileId': file_id, 'removed': True})
+                else:
+                    changes.append({'fileId': file_id, 'removed': False, 'file': drive_file(file)})
+            result = {'changes': changes}
+            if end < len(log):
+                result['nextPageToken'] = str(end)
+            else:
+                result['newStartPageToken'] = str(end)
+            return result
+        return self._request('drive', 'read', 'changes.list', call)
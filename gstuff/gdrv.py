@@ -1,58 +1,103 @@
 import os.path
 import logging
+import threading
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from gstuff.executor import BATCH_MAX_REQUESTS
+from gstuff.executor import get_executor
 
 
 logger = logging.getLogger(__name__)
 
 
 SCOPES = ['https://www.googleapis.com/auth/drive']
+TOKEN_FILE = 'token.json'
+CREDENTIALS_FILE = 'credentials.json'
 
 
 def authorize():
     creds = None
-    if os.path.exists('token.json'):
-        creds = Credentials.from_authorized_user_file('token.json', SCOPES)
+    if os.path.exists(TOKEN_FILE):
+        creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
     if not creds or not creds.valid:
         if creds and creds.expired and creds.refresh_token:
             creds.refresh(Request())
         else:
             flow = InstalledAppFlow.from_client_secrets_file(
-                'credentials.json', SCOPES)
+                CREDENTIALS_FILE, SCOPES)
             creds = flow.run_local_server(port=0)
-        with open('token.json', 'w') as token:
-            token.write(creds.to_json())
+        save_token(creds)
     return creds
 
 
+def save_token(creds):
+    with open(TOKEN_FILE, 'w') as token:
+        token.write(creds.to_json())
+
+
 class Drive:
 
-    def __init__(self):
-        self.credentials = authorize()
-        self.service = build('drive', 'v3', credentials=self.credentials, cache_discovery=False)
+    def __init__(self, credentials=None, service=None, executor=None):
+        """Without arguments the user is authorized and a new Drive service is built. Pass "credentials" and/or
+        "service" (see gstuff.clients.ClientPool) to reuse ones that already exist."""
+        self.credentials = credentials if credentials is not None else authorize()
+        self.service = service if service is not None else build('drive', 'v3', credentials=self.credentials, cache_discovery=False)
+        self.executor = executor if executor is not None else get_executor()
 
     def id_to_name(self, file_id):
         try:
-            results = self.service.files().get(fileId=file_id, fields="name").execute()
+            results = self.executor.execute(self.service.files().get(fileId=file_id, fields="name"), 'drive', 'read')
             return results.get('name', '')
 
         except HttpError as error:
             print(f'An error occurred: {error}')
             return ''
 
-    def list_from_query(self, query):
+    def get_metadata(self, file_id, fields='id, name, version, modifiedTime'):
         try:
-            results = self.service.files().list(
+            return self.executor.execute(self.service.files().get(fileId=file_id, fields=fields), 'drive', 'read')
+
+        except HttpError as error:
+            print(f'An error occurred: {error}')
+            return None
+
+    def exists(self, file_id):
+        """Return True if the file exists and is not in the trash, False if it does not, or None if that could not be
+        found out."""
+        try:
+            file = self.executor.execute(self.service.files().get(fileId=file_id, fields='id, trashed'), 'drive', 'read')
+            return not file.get('trashed', False)
+
+        except HttpError as error:
+            if error.resp.status == 404:
+                return False
+            print(f'An error occurred: {error}')
+            return None
+
+    def iter_files(self, query, fields='id, name', page_size=1000):
+        """Yield every file matching "query", following nextPageToken through all of the pages. "fields" is the field
+        mask for each file, e.g. 'id, name, mimeType, parents, modifiedTime, version'. Errors are raised (after the
+        executor's retries) rather than ending the listing early, so a listing is never silently incomplete."""
+        page_token = None
+        while True:
+            results = self.executor.execute(self.service.files().list(
                 q=query,
                 spaces='drive',
-                fields="nextPageToken, files(id, name)"
-            ).execute()
+                fields=f'nextPageToken, files({fields})',
+                pageSize=page_size,
+                pageToken=page_token
+            ), 'drive', 'read')
+            yield from results.get('files', [])
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                return
 
-            items = results.get('files', [])
+    def list_from_query(self, query, fields='id, name'):
+        try:
+            items = list(self.iter_files(query, fields))
 
             if not items:
                 print('No files found.')
@@ -64,21 +109,98 @@ class Drive:
             print(f'An error occurred: {error}')
             return []
 
+    def iter_folder(self, folder_id, fields='id, name', include_trashed=False):
+        """Yield the files in a folder."""
+        query = f"'{folder_id}' in parents"
+        if not include_trashed:
+            query += ' and trashed = false'
+        yield from self.iter_files(query, fields)
+
+    def start_page_token(self):
+        """Return the token for changes made from now on (see changes)."""
+        results = self.executor.execute(self.service.changes().getStartPageToken(), 'drive', 'read')
+        return results['startPageToken']
+
+    def changes(self, page_token, fields='id, name', page_size=1000):
+        """Return the changes made since "page_token" (from start_page_token or an earlier call), following all of the
+        pages, and the token to pass next time. Each change has a fileId, whether the file was removed, and the file
+        with the given field mask if it was not."""
+        changes = []
+        while True:
+            results = self.executor.execute(self.service.changes().list(
+                pageToken=page_token,
+                spaces='drive',
+                includeRemoved=True,
+                fields=f'nextPageToken, newStartPageToken, changes(fileId, removed, file({fields}))',
+                pageSize=page_size
+            ), 'drive', 'read')
+            changes.extend(results.get('changes', []))
+            if 'newStartPageToken' in results:
+                return changes, results['newStartPageToken']
+            page_token = results['nextPageToken']
+
+    def batch(self, requests, kind='read'):
+        """Execute {key: request} in batch HTTP requests and return (results, errors); see
+        RequestExecutor.execute_batch."""
+        return self.executor.execute_batch(self.service.new_batch_http_request, requests, 'drive', kind)
+
+    def names_for_ids(self, file_ids):
+        """Return {file id: name} for "file_ids", like id_to_name but in batches; the name is '' for a file that
+        could not be read."""
+        file_ids = list(dict.fromkeys(file_ids))
+        try:
+            results, errors = self.batch({file_id: self.service.files().get(fileId=file_id, fields='name')
+                                          for file_id in file_ids})
+        except HttpError as error:
+            print(f'An error occurred: {error}')
+            return {file_id: '' for file_id in file_ids}
+        for file_id, error in errors.items():
+            print(f'An error occurred: {error}')
+        return {file_id: results[file_id].get('name', '') if file_id in results else '' for file_id in file_ids}
+
+    def move_many(self, file_ids, source, target):
+        """Move several files from "source" to "target", like move but in batches. Return {file id: file id} for the
+        files that were moved and {file id: None} for the ones that were not."""
+        file_ids = list(dict.fromkeys(file_ids))
+        requests = {}
+        for file_id in file_ids:
+            if source:
+                requests[file_id] = self.service.files().update(
+                    fileId=file_id,
+                    addParents=target,
+                    removeParents=source,
+                    fields='id'
+                )
+            else:
+                requests[file_id] = self.service.files().update(
+                    fileId=file_id,
+                    addParents=target,
+                    fields='id'
+                )
+        try:
+            results, errors = self.batch(requests, 'write')
+        except HttpError as error:
+            print(f'Unable to move {len(file_ids)} files from {source} to {target}: {error}')
+            return {file_id: None for file_id in file_ids}
+        for file_id, error in errors.items():
+            print(f'Unable to move file, {file_id} from {source} to {target}: {error}')
+        return {file_id: results[file_id]['id'] if file_id in results else None for file_id in file_ids}
+
     def move(self, file_id, source, target):
         try:
             if source:
-                file = self.service.files().update(
+                file = self.executor.execute(self.service.files().update(
                     fileId=file_id,
                     addParents=target,
                     removeParents=source,
                     fields='name, id, parents'
-                ).execute()
+                ), 'drive', 'write')
             else:
-                file = self.service.files().update(
+                file = self.executor.execute(self.service.files().update(
                     fileId=file_id,
                     addParents=target,
                     fields='name, id, parents'
-                ).execute()
+                ), 'drive', 'write')
             return file['id']
 
         except HttpError as error:
@@ -86,3 +208,49 @@ class Drive:
             return None
 
 
+class MoveQueue:
+    """Moves queued from any number of threads and made with Drive.move_many, a full batch at a time.
+
+    "drive" is called to get the Drive to send a batch with, e.g. ClientPool.drive, so each thread uses its own
+    service. Call flush() when done to send the moves still queued. "moved" maps each file id to its id once moved,
+    or to None if it could not be moved. "on_moved", if given, is called with that mapping for each batch sent.
+    """
+
+    def __init__(self, drive, batch_size=BATCH_MAX_REQUESTS, on_moved=None):
+        self.drive = drive
+        self.batch_size = batch_size
+        self.on_moved = on_moved
+        self.moved = {}
+        self._pending = {}
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def add(self, file_id, source, target):
+        with self._lock:
+            self._pending.setdefault((source, target), []).append(file_id)
+            self._count += 1
+            pending = self._take() if self._count >= self.batch_size else None
+        if pending:
+            self._send(pending)
+
+    def _take(self):
+        pending = self._pending
+        self._pending = {}
+        self._count = 0
+        return pending
+
+    def _send(self, pending):
+        drive = self.drive()
+        for (source, target), file_ids in pending.items():
+            moved = drive.move_many(file_ids, source, target)
+            with self._lock:
+                self.moved.update(moved)
+            if self.on_moved:
+                self.on_moved(moved)
+
+    def flush(self):
+        """Make the moves still queued and return the ids of the files that could not be moved."""
+        with self._lock:
+            pending = self._take()
+        self._send(pending)
+        return [file_id for file_id, moved in self.moved.items() if moved is None]
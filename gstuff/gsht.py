@@ -1,24 +1,74 @@
+from collections.abc import Sequence
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from gstuff.executor import get_executor
 import logging
-import time
 
 
 logger = logging.getLogger(__name__)
 
 
+# Limits for a single values.batchGet call when loading a workbook in bulk. The cell limit is an estimate based on
+# each tab's grid size and keeps individual responses to a manageable size.
+BATCH_GET_MAX_RANGES = 100
+BATCH_GET_MAX_CELLS = 2000000
+
+
+def a1_sheet_range(name):
+    """Return the A1 notation range covering the whole of sheet "name", quoting it as required."""
+    return "'" + name.replace("'", "''") + "'"
+
+
+def column_letter(col):
+    """Return the A1 column letters for the 0-based column index "col"."""
+    letters = ''
+    col += 1
+    while col:
+        col, remainder = divmod(col - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+
+def a1_range(name, row, col, last_row, last_col):
+    """Return the A1 notation of a range of sheet "name" given 0-based, inclusive row and column indexes."""
+    return f'{a1_sheet_range(name)}!{column_letter(col)}{row + 1}:{column_letter(last_col)}{last_row + 1}'
+
+
+def runs(indexes):
+    """Return the (first, last) pairs of the runs of consecutive numbers in the sorted list "indexes"."""
+    rv = []
+    for i in indexes:
+        if rv and rv[-1][1] == i - 1:
+            rv[-1] = (rv[-1][0], i)
+        else:
+            rv.append((i, i))
+    return rv
+
+
 class GSManager:
 
-    def __init__(self, credentials):
+    def __init__(self, credentials, service=None, drive_service=None, executor=None):
         self.credentials = credentials
-        self.service = build('sheets', 'v4', credentials=self.credentials, cache_discovery=False)
+        self.service = service if service is not None else build('sheets', 'v4', credentials=self.credentials, cache_discovery=False)
+        self._drive_service = drive_service
+        self.executor = executor if executor is not None else get_executor()
         logger.info(f'GSManager initialized with credentials: {self.credentials}')
 
-    def get_workbook(self, file_id):
+    @property
+    def drive_service(self):
+        """The Drive service used to place new workbooks in folders, built on first use."""
+        if self._drive_service is None:
+            self._drive_service = build('drive', 'v3', credentials=self.credentials, cache_discovery=False)
+        return self._drive_service
+
+    def get_workbook(self, file_id, bulk=False, cache=None, columnar=False):
+        """If a gstuff.cache.WorkbookCache is given the workbook is taken from it when it has not changed on Drive."""
         logger.info(f'Getting workbook with id: {file_id}')
-        return Workbook(file_id, self.service)
+        if cache is not None:
+            return cache.get_workbook(self, file_id, columnar=columnar)
+        return Workbook(file_id, self.service, bulk=bulk, executor=self.executor, columnar=columnar)
 
-    def create_vs_workbook(self, name, vs_kind, desc_vals, cont_vals):
+    def create_vs_workbook(self, name, vs_kind, desc_vals, cont_vals, folder_id=None, fast=False, moves=None):
         """Create a workbook with two sheets and return it.
             The first sheet is called "Description" and it contains the general desription of the value set in the form
             of name (column A) and value (column B) pairs.
@@ -30,7 +80,15 @@ class GSManager:
                 "desc_vals": A list of lists containing the name and value pairs for the first sheet.
                 "cont_vals": A list of lists containing the values (concepts) for the second sheet. The contents vary
                 based on the type of ValueSet being created.
+                "folder_id": The Drive folder the workbook is placed in. By default it is left in the user's root.
+                "fast": When True the values are sent with the spreadsheets.create call itself, the workbook is moved
+                straight to "folder_id" and a WorkbookHandle is returned instead of a loaded Workbook. This takes one
+                call (two with a folder) instead of four or more.
+                "moves": A gstuff.gdrv.MoveQueue. When given, the move to "folder_id" is queued on it, to be sent in a
+                batch with other moves, instead of being made straight away.
         """
+        if fast:
+            return self._create_vs_workbook_fast(name, vs_kind, desc_vals, cont_vals, folder_id, moves)
         try:
             spreadsheet = {
                 'properties': {
@@ -49,7 +107,9 @@ class GSManager:
                     }
                 ]
             }
-            spreadsheet = self.service.spreadsheets().create(body=spreadsheet, fields='spreadsheetId').execute()
+            spreadsheet = self.executor.execute(
+                self.service.spreadsheets().create(body=spreadsheet, fields='spreadsheetId'), 'sheets', 'write',
+                idempotent=False)
             spreadsheet_id = spreadsheet.get('spreadsheetId')
 
             data = [
@@ -66,7 +126,10 @@ class GSManager:
                 'valueInputOption': 'RAW',
                 'data': data
             }
-            result = self.service.spreadsheets().values().batchUpdate(spreadsheetId=spreadsheet_id, body=body).execute()
+            result = self.executor.execute(
+                self.service.spreadsheets().values().batchUpdate(spreadsheetId=spreadsheet_id, body=body), 'sheets', 'write')
+            if folder_id:
+                self._move_to_folder(spreadsheet_id, folder_id, moves)
 
             return self.get_workbook(spreadsheet_id)
 
@@ -74,30 +137,220 @@ class GSManager:
             logger.error(f'An error occurred: {error}')
             return None
 
+    def _create_vs_workbook_fast(self, name, vs_kind, desc_vals, cont_vals, folder_id, moves=None):
+        try:
+            spreadsheet = {
+                'properties': {
+                    'title': name
+                },
+                'sheets': [
+                    sheet_with_values('Description', desc_vals),
+                    sheet_with_values(vs_kind.capitalize(), cont_vals)
+                ]
+            }
+            spreadsheet = self.executor.execute(
+                self.service.spreadsheets().create(body=spreadsheet, fields='spreadsheetId'), 'sheets', 'write',
+                idempotent=False)
+            spreadsheet_id = spreadsheet.get('spreadsheetId')
+            if folder_id:
+                self._move_to_folder(spreadsheet_id, folder_id, moves)
+            return WorkbookHandle(spreadsheet_id, name)
+
+        except HttpError as error:
+            logger.error(f'An error occurred: {error}')
+            return None
+
+    def update_vs_workbook(self, file_id, name, vs_kind, desc_vals, cont_vals):
+        """Replace the contents of a workbook made by create_vs_workbook with new "desc_vals" and "cont_vals", in two
+        calls: one to clear the Description and content sheets and one to write them. Return a WorkbookHandle, or
+        None if the workbook could not be updated (e.g. it was deleted or has no sheet for "vs_kind")."""
+        try:
+            titles = ['Description', vs_kind.capitalize()]
+            body = {'ranges': [a1_sheet_range(title) for title in titles]}
+            self.executor.execute(
+                self.service.spreadsheets().values().batchClear(spreadsheetId=file_id, body=body), 'sheets', 'write')
+            body = {
+                'valueInputOption': 'RAW',
+                'data': [
+                    {
+                        'range': a1_sheet_range(titles[0]),
+                        'values': desc_vals
+                    },
+                    {
+                        'range': a1_sheet_range(titles[1]),
+                        'values': cont_vals
+                    }
+                ]
+            }
+            self.executor.execute(
+                self.service.spreadsheets().values().batchUpdate(spreadsheetId=file_id, body=body), 'sheets', 'write')
+            return WorkbookHandle(file_id, name)
+
+        except HttpError as error:
+            logger.error(f'Unable to update workbook {file_id}: {error}')
+            return None
+
+    def _move_to_folder(self, file_id, folder_id, moves=None):
+        """Move a newly created file from the user's root to "folder_id", or queue the move on "moves"."""
+        if moves is not None:
+            moves.add(file_id, 'root', folder_id)
+            return
+        self.executor.execute(self.drive_service.files().update(
+            fileId=file_id,
+            addParents=folder_id,
+            removeParents='root',
+            fields='id'
+        ), 'drive', 'write')
+
+
+def cell_data(value):
+    """Return the CellData for "value", entered as is (like the RAW value input option)."""
+    if isinstance(value, bool):
+        return {'userEnteredValue': {'boolValue': value}}
+    if isinstance(value, (int, float)):
+        return {'userEnteredValue': {'numberValue': value}}
+    if value is None or value == '':
+        return {}
+    return {'userEnteredValue': {'stringValue': str(value)}}
+
+
+def sheet_with_values(title, values):
+    """Return a Sheet resource called "title" that contains "values", for use in a spreadsheets.create body."""
+    columns = max([len(row) for row in values], default=0)
+    return {
+        'properties': {
+            'title': title,
+            'gridProperties': {
+                'rowCount': max(len(values), 1000),
+                'columnCount': max(columns, 26)
+            }
+        },
+        'data': [
+            {
+                'startRow': 0,
+                'startColumn': 0,
+                'rowData': [{'values': [cell_data(value) for value in row]} for row in values]
+            }
+        ]
+    }
+
+
+class WorkbookHandle:
+    """The id and name of a workbook, for when the contents are not needed. Use GSManager.get_workbook to load it."""
+
+    def __init__(self, file_id, name):
+        self.file_id = file_id
+        self.name = name
+
+    def __repr__(self):
+        return f'WorkbookHandle({self.file_id!r}, {self.name!r})'
+
 
 class Workbook:
 
-    def __init__(self, file_id, sheets_service):
+    def __init__(self, file_id, sheets_service, bulk=False, executor=None, snapshot=None, columnar=False):
+        """Sheet values are loaded lazily, on first access. When "bulk" is True the values of all tabs are fetched
+        up front with as few values.batchGet calls as possible (see prefetch). When a "snapshot" (see
+        Workbook.snapshot) is given the workbook is built from it without any calls. "columnar" is passed on to
+        every Sheet."""
         self.service = sheets_service
+        self.executor = executor if executor is not None else get_executor()
         self.file_id = file_id
+        self.bulk = bulk
+        self.columnar = columnar
         self.name = ''
         self.sheets = {}
+        self._sheet_properties = {}
+        if snapshot is not None:
+            self._load_snapshot(snapshot)
+            return
         try:
-            metadata = self.service.spreadsheets().get(spreadsheetId=self.file_id).execute()
-            self.name = metadata.get('properties', '').get('title', '')
-            sheets = metadata.get('sheets', [])
-            for count, sheet in enumerate(sheets, start=1):
-                sheet_properties = sheet.get('properties', {})
-                sheet_title = sheet_properties.get('title')
-                #if count == 61:
-                #    print("Reached 60 sheets, waiting a minute.")
-                #    time.sleep(60)
-                #print(str(count)+". CURRENT SHEET IS "+sheet_title)
-                self.sheets[sheet_title] = Sheet(self, sheet_title)
+            metadata = self._get_metadata()
+            self.name = metadata.get('properties', {}).get('title', '')
+            self._build_sheets(metadata)
+            if self.bulk:
+                self.prefetch()
         except HttpError as error:
             logger.error(f'An error occurred while initializing Workbook: {error}')
         logger.debug(f'Workbook ({self.name}) initialized. Workbook id: {self.file_id}')
 
+    def _get_metadata(self):
+        return self.executor.execute(self.service.spreadsheets().get(
+            spreadsheetId=self.file_id,
+            fields='properties.title,sheets.properties(sheetId,title,gridProperties)'
+        ), 'sheets', 'read')
+
+    def _build_sheets(self, metadata):
+        """Create a (not yet loaded) Sheet for every tab in "metadata", keeping the Sheet objects that already exist."""
+        sheets = {}
+        self._sheet_properties = {}
+        for sheet in metadata.get('sheets', []):
+            sheet_properties = sheet.get('properties', {})
+            sheet_title = sheet_properties.get('title')
+            self._sheet_properties[sheet_title] = sheet_properties
+            sheets[sheet_title] = self.sheets.get(sheet_title) or Sheet(self, sheet_title, columnar=self.columnar)
+        self.sheets = sheets
+
+    def snapshot(self):
+        """Return the name, sheet properties and values of this workbook as a JSON-serializable dict, loading any
+        sheets that have not been loaded yet."""
+        self.prefetch()
+        return {
+            'file_id': self.file_id,
+            'name': self.name,
+            'sheets': [{'properties': self._sheet_properties.get(name, {'title': name}), 'values': sheet.values}
+                       for name, sheet in self.sheets.items()]
+        }
+
+    def _load_snapshot(self, snapshot):
+        self.name = snapshot.get('name', '')
+        self._build_sheets(snapshot)
+        for sheet in snapshot.get('sheets', []):
+            self.sheets[sheet['properties']['title']].set_values(sheet.get('values', []))
+
+    def prefetch(self, names=None):
+        """Load the values of the named sheets (all sheets if "names" is None) that are not loaded yet, using
+        batched values.batchGet calls."""
+        if names is None:
+            names = self.sheet_names()
+        pending = [name for name in names if name in self.sheets and not self.sheets[name].loaded]
+        if not pending:
+            return
+        values = self._batch_get_values([self._sheet_properties.get(name, {'title': name}) for name in pending])
+        for name in pending:
+            self.sheets[name].set_values(values.get(name, []))
+
+    def _batch_get_values(self, properties):
+        """Fetch the values of the given sheets (a list of sheet properties) and return them keyed by sheet title.
+        Sheets are grouped into chunks of at most BATCH_GET_MAX_RANGES ranges and (by grid size) roughly
+        BATCH_GET_MAX_CELLS cells, and each chunk is fetched with one values.batchGet call."""
+        chunks = []
+        chunk = []
+        chunk_cells = 0
+        for sheet_properties in properties:
+            grid = sheet_properties.get('gridProperties', {})
+            cells = grid.get('rowCount', 1000) * grid.get('columnCount', 26)
+            if chunk and (len(chunk) >= BATCH_GET_MAX_RANGES or chunk_cells + cells > BATCH_GET_MAX_CELLS):
+                chunks.append(chunk)
+                chunk = []
+                chunk_cells = 0
+            chunk.append(sheet_properties.get('title'))
+            chunk_cells += cells
+        if chunk:
+            chunks.append(chunk)
+
+        values = {}
+        for chunk in chunks:
+            result = self.executor.execute(self.service.spreadsheets().values().batchGet(
+                spreadsheetId=self.file_id,
+                ranges=[a1_sheet_range(title) for title in chunk]
+            ), 'sheets', 'read')
+            # Value ranges are returned in the same order as the requested ranges.
+            for title, value_range in zip(chunk, result.get('valueRanges', [])):
+                values[title] = value_range.get('values', [])
+        logger.debug(f'Loaded {len(values)} sheets in {len(chunks)} batchGet call(s) for workbook {self.file_id}')
+        return values
+
     def sheet_names(self):
         return [sheet for sheet in self.sheets]
 
@@ -120,7 +373,8 @@ class Workbook:
             body = {
                 'requests': requests
             }
-            response = self.service.spreadsheets().batchUpdate(spreadsheetId=self.file_id, body=body).execute()
+            response = self.executor.execute(
+                self.service.spreadsheets().batchUpdate(spreadsheetId=self.file_id, body=body), 'sheets', 'write')
             self._refresh_sheets()
 
         except HttpError as error:
@@ -141,26 +395,42 @@ class Workbook:
         return self.sheets.get(name)
 
     def _refresh_sheets(self):
-        self.sheets = {}
         try:
-            metadata = self.service.spreadsheets().get(spreadsheetId=self.file_id).execute()
-            sheets = metadata.get('sheets', [])
-            for sheet in sheets:
-                sheet_properties = sheet.get('properties', {})
-                sheet_title = sheet_properties.get('title')
-                self.sheets[sheet_title] = Sheet(self, sheet_title)
+            self._build_sheets(self._get_metadata())
         except HttpError as error:
             logger.error(f'An error occurred while refreshing sheets: {error}')
 
     def get_sheet_names(self):
-        self.sheet_names = []
-        metadata = self.service.spreadsheets().get(spreadsheetId=self.file_id).execute()
+        # a local list, so that the sheet_names method is not replaced by it
+        sheet_names = []
+        metadata = self._get_metadata()
         sheets = metadata.get('sheets', [])
         for sheet in sheets:
             sheet_properties = sheet.get('properties', {})
             sheet_title = sheet_properties.get('title')
-            self.sheet_names.append(sheet_title)
-        return self.sheet_names
+            sheet_names.append(sheet_title)
+        return sheet_names
+
+    def write_data(self, data):
+        """Write a list of ValueRange dicts with one values.batchUpdate call."""
+        body = {
+            'valueInputOption': 'USER_ENTERED',
+            'data': data
+        }
+        return self.executor.execute(
+            self.service.spreadsheets().values().batchUpdate(spreadsheetId=self.file_id, body=body), 'sheets', 'write')
+
+    def flush(self):
+        """Save the pending edits of all sheets with a single values.batchUpdate call."""
+        dirty = [sheet for sheet in self.sheets.values() if sheet.loaded and sheet.dirty]
+        data = []
+        for sheet in dirty:
+            data.extend(sheet.pending_data())
+        if not data:
+            return
+        self.write_data(data)
+        for sheet in dirty:
+            sheet.mark_saved()
 
     def append_row_to_sheet(self, sheet_name, values):
         sheet = self.get_or_create_sheet(sheet_name)
@@ -168,64 +438,214 @@ class Workbook:
         sheet.save()
 
 
+class ColumnView(Sequence):
+    """A read-only view of one column of a columnar Sheet, "rows" long. Cells past the end of the stored (ragged)
+    column read as the sheet's missing value."""
+
+    def __init__(self, column, rows, missing_default=''):
+        self._column = column
+        self._rows = rows
+        self._missing_default = missing_default
+
+    def __len__(self):
+        return self._rows
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._rows))]
+        if index < 0:
+            index += self._rows
+        if not 0 <= index < self._rows:
+            raise IndexError('column index out of range')
+        return self._column[index] if index < len(self._column) else self._missing_default
+
+    def __iter__(self):
+        column = self._column
+        stored = min(len(column), self._rows)
+        for i in range(stored):
+            yield column[i]
+        for _ in range(stored, self._rows):
+            yield self._missing_default
+
+
 class Sheet:
 
-    def __init__(self, wb, name, missing_default=''):
-        """header_row and data_name_row are 0-based indexes. -1 means no header or data names"""
+    def __init__(self, wb, name, missing_default='', values=None, columnar=False):
+        """header_row and data_name_row are 0-based indexes. -1 means no header or data names.
+        The values are fetched on first access unless they are given here (e.g. from a bulk load of the workbook).
+        A "columnar" sheet stores its values by column, without padding short rows. get_col then returns a
+        ColumnView instead of a copy, and "values" is built from the columns on each access, so it should not be
+        changed in place."""
         self.wb = wb
         self.name = name
-        self.rows = 0
-        self.cols = 0
-        self._raw_sheet = self.wb.service.spreadsheets().values().get(spreadsheetId=wb.file_id, range=self.name).execute()
-        self.values = self._raw_sheet.get('values', [])
-        self.rows = len(self.values)
+        self.missing_default = missing_default
+        self.columnar = columnar
         self.header = []
         self.data_names = []
         self.col_names = {}
-        for r in self.values:
-            self.cols = max(self.cols, len(r))
-        for r in self.values:
-            while len(r) < self.cols:
-                r.append(missing_default)
+        self._values = None
+        self._columns = None
+        self._rows = 0
+        self._cols = 0
+        # Edits not saved yet: 0-based indexes of rows written as a whole, and of single cells by row.
+        self._dirty_rows = set()
+        self._dirty_cells = {}
+        if values is not None:
+            self.set_values(values)
+
+    @property
+    def loaded(self):
+        return self._values is not None or self._columns is not None
+
+    def load(self):
+        """Fetch the values of this sheet, replacing any values already loaded."""
+        logger.debug(f'Loading sheet {self.name} of workbook {self.wb.file_id}')
+        self._raw_sheet = self.wb.executor.execute(self.wb.service.spreadsheets().values().get(
+            spreadsheetId=self.wb.file_id,
+            range=a1_sheet_range(self.name)
+        ), 'sheets', 'read')
+        self.set_values(self._raw_sheet.get('values', []))
+
+    def set_values(self, values):
+        """Use "values" (a list of rows) as the contents of this sheet, padding every row to the same length (or,
+        for a columnar sheet, splitting them into columns)."""
+        self._rows = len(values)
+        self._cols = 0
+        self._dirty_rows = set()
+        self._dirty_cells = {}
+        for r in values:
+            self._cols = max(self._cols, len(r))
+        if self.columnar:
+            self._values = None
+            self._columns = [[] for _ in range(self._cols)]
+            for i, r in enumerate(values):
+                for j, value in enumerate(r):
+                    column = self._columns[j]
+                    if len(column) < i:
+                        column.extend([self.missing_default] * (i - len(column)))
+                    column.append(value)
+            return
+        self._values = values
+        for r in values:
+            while len(r) < self._cols:
+                r.append(self.missing_default)
+
+    def _ensure_loaded(self):
+        if not self.loaded:
+            self.load()
+
+    @property
+    def values(self):
+        self._ensure_loaded()
+        if self.columnar:
+            return [self.get_row(i) for i in range(self._rows)]
+        return self._values
+
+    @values.setter
+    def values(self, values):
+        if self.columnar:
+            self.set_values(values)
+        else:
+            self._values = values
+
+    @property
+    def rows(self):
+        self._ensure_loaded()
+        return self._rows
+
+    @rows.setter
+    def rows(self, rows):
+        self._ensure_loaded()
+        self._rows = rows
+
+    @property
+    def cols(self):
+        self._ensure_loaded()
+        return self._cols
+
+    @cols.setter
+    def cols(self, cols):
+        self._ensure_loaded()
+        self._cols = cols
 
     def set_header_row(self, row):
         if -1 < row < self.rows:
-            self.header = self.values[row]
+            self.header = self.get_row(row)
 
     def set_data_name_row(self, row):
         if -1 < row < self.rows:
-            self.data_names = self.values[row]
+            self.data_names = self.get_row(row)
         for i in range(len(self.data_names)):
             if self.data_names[i]:
                 self.col_names[self.data_names[i]] = i
 
-    def get_cell(self, row, col):
+    def _col_index(self, col):
         if isinstance(col, int):
-            return self.values[row][col]
+            return col
         elif isinstance(col, str) and col in self.col_names:
-            return self.values[row][self.col_names[col]]
-        else:
-            logger.error(f'Column {col} not found in sheet {self.name}')
+            return self.col_names[col]
+        logger.error(f'Column {col} not found in sheet {self.name}')
+        return None
+
+    def get_cell(self, row, col):
+        col = self._col_index(col)
+        if col is None:
             return None
-        
+        if self.columnar:
+            self._ensure_loaded()
+            if row >= self._rows or col >= self._cols:
+                raise IndexError('cell index out of range')
+            column = self._columns[col]
+            return column[row] if row < len(column) else self.missing_default
+        return self.values[row][col]
+
     def get_row(self, row):
+        if self.columnar:
+            self._ensure_loaded()
+            if row < 0:
+                row += self._rows
+            if not 0 <= row < self._rows:
+                raise IndexError('row index out of range')
+            return [column[row] if row < len(column) else self.missing_default for column in self._columns]
         return self.values[row]
 
     def get_col(self,col):
-        column = []
-        if isinstance(col,int):
-            for i in range(self.rows):
-                column.append(self.values[i][col])
-            return column
-        elif isinstance(col, str) and col in self.col_names:
-            for i in range(self.rows):
-                column.append(self.values[i][col])
-            return column
-        else:
-            logger.error(f'Column {col} not found in sheet {self.name}')
+        col = self._col_index(col)
+        if col is None:
             return None
-            
+        if self.columnar:
+            self._ensure_loaded()
+            return ColumnView(self._columns[col], self._rows, self.missing_default)
+        column = []
+        for i in range(self.rows):
+            column.append(self.values[i][col])
+        return column
+
+    def _set_column_cell(self, row, col, value):
+        """Set a cell of a columnar sheet (0-based indexes), growing the sheet as needed."""
+        while len(self._columns) <= col:
+            self._columns.append([])
+        column = self._columns[col]
+        if len(column) <= row:
+            column.extend([self.missing_default] * (row - len(column) + 1))
+        column[row] = value
+        self._rows = max(self._rows, row + 1)
+        self._cols = max(self._cols, col + 1)
+
+    def _set_column_row(self, row, values):
+        for col in range(max(len(values), self._cols)):
+            if col < len(values):
+                self._set_column_cell(row, col, values[col])
+            elif row < len(self._columns[col]):
+                self._columns[col][row] = self.missing_default
+        self._rows = max(self._rows, row + 1)
+
     def write_cell(self, row, col, value):
+        if self.columnar:
+            self._ensure_loaded()
+            self._set_column_cell(row-1, col-1, value)
+            self._dirty_cells.setdefault(row-1, set()).add(col-1)
+            return
         if row > self.rows:
             self.rows = row
         if col > self.cols:
@@ -235,31 +655,91 @@ class Sheet:
         while len(self.values[row-1]) < col:
             self.values[row-1].append('')
         self.values[row-1][col-1] = value
+        self._dirty_cells.setdefault(row-1, set()).add(col-1)
 
     def write_row(self, row, values):
+        if self.columnar:
+            self._ensure_loaded()
+            self._set_column_row(row-1, values)
+            self._dirty_rows.add(row-1)
+            return
         if row > self.rows:
             self.rows = row
         while len(self.values) < row:
             self.values.append([])
         self.values[row-1] = values
         self.cols = max(self.cols, len(values))
+        self._dirty_rows.add(row-1)
 
     def append_row(self, values):
+        if self.columnar:
+            self._ensure_loaded()
+            self._set_column_row(self._rows, values)
+            self._dirty_rows.add(self._rows - 1)
+            return
         self.rows += 1
         self.values.append(values)
         self.cols = max(self.cols, len(values))
+        self._dirty_rows.add(len(self.values) - 1)
 
     def trim_empty_rows(self):
+        if self.columnar:
+            return
         while len(self.values) > self.rows:
             self.values.pop()
 
-    def save(self):
-        body = {
-            'values': self.values
-        }
-        self.wb.service.spreadsheets().values().update(
-            spreadsheetId=self.wb.file_id,
-            range=self.name,
-            valueInputOption='USER_ENTERED',
-            body=body
-        ).execute()
+    @property
+    def dirty(self):
+        """True if there are edits made through write_cell, write_row or append_row that have not been saved."""
+        return bool(self._dirty_rows or self._dirty_cells)
+
+    def pending_data(self):
+        """Return the unsaved edits as a list of ValueRange dicts for values.batchUpdate. Consecutive rows written as
+        a whole are sent as one range, and so are blocks of cells written next to each other."""
+        data = []
+        for first, last in runs(sorted(self._dirty_rows)):
+            values = [self.get_row(r) for r in range(first, last + 1)]
+            width = max([len(row) for row in values] + [1])
+            data.append({
+                'range': a1_range(self.name, first, 0, last, width - 1),
+                'values': values
+            })
+        # Runs of neighbouring cells within a row, then runs over the same columns in consecutive rows.
+        cell_runs = {}
+        for row in sorted(self._dirty_cells):
+            if row not in self._dirty_rows:
+                for cols in runs(sorted(self._dirty_cells[row])):
+                    cell_runs.setdefault(cols, []).append(row)
+        for (first_col, last_col), rows in sorted(cell_runs.items()):
+            for first, last in runs(rows):
+                data.append({
+                    'range': a1_range(self.name, first, first_col, last, last_col),
+                    'values': [[self.get_cell(r, c) for c in range(first_col, last_col + 1)]
+                               for r in range(first, last + 1)]
+                })
+        return data
+
+    def mark_saved(self):
+        self._dirty_rows = set()
+        self._dirty_cells = {}
+
+    def save(self, full=False):
+        """Write the edits made since the last save in one values.batchUpdate call. With "full" (needed after
+        changing "values" directly) the whole sheet is written instead."""
+        if full:
+            body = {
+                'values': self.values
+            }
+            self.wb.executor.execute(self.wb.service.spreadsheets().values().update(
+                spreadsheetId=self.wb.file_id,
+                range=a1_sheet_range(self.name),
+                valueInputOption='USER_ENTERED',
+                body=body
+            ), 'sheets', 'write')
+            self.mark_saved()
+            return
+        data = self.pending_data()
+        if not data:
+            return
+        self.wb.write_data(data)
+        self.mark_saved()
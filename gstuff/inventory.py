@@ -0,0 +1,125 @@
+from googleapiclient.errors import HttpError
+import json
+import logging
+import os
+
+
+logger = logging.getLogger(__name__)
+
+
+INVENTORY_FIELDS = 'id, name, mimeType, parents, modifiedTime, version, trashed'
+# the fields the inventory itself relies on, added to any "fields" that leave them out
+REQUIRED_FIELDS = ('id', 'name', 'parents', 'trashed')
+
+
+def with_required_fields(fields):
+    names = [name.strip() for name in fields.split(',') if name.strip()]
+    return ', '.join(names + [name for name in REQUIRED_FIELDS if name not in names])
+
+
+class FolderInventory:
+    """The files in a set of Drive folders, e.g. the staging and intensional value set folders.
+
+    The first refresh() lists the folders in full, following every page. Later refreshes only read the Drive changes
+    feed since the previous one and apply it, so keeping the inventory current costs one or two requests however
+    many files there are. With a "path" the inventory and its changes token are saved there, so the next run starts
+    from them instead of listing everything again.
+    """
+
+    def __init__(self, drive, folder_ids, path=None, fields=INVENTORY_FIELDS):
+        self.drive = drive
+        self.folder_ids = tuple(folder_ids)
+        self.path = path
+        self.fields = with_required_fields(fields)
+        self.files = {}
+        self.page_token = None
+        if path:
+            self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        if tuple(saved.get('folder_ids', ())) != self.folder_ids or saved.get('fields') != self.fields:
+            return
+        self.files = saved['files']
+        self.page_token = saved['page_token']
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'folder_ids': self.folder_ids, 'fields': self.fields, 'page_token': self.page_token,
+                       'files': self.files}, f)
+        os.replace(tmp_path, self.path)
+
+    def refresh(self):
+        """Bring the inventory up to date and return it."""
+        if self.page_token is None:
+            self.full_refresh()
+        else:
+            try:
+                self.apply_changes()
+            except HttpError as error:
+                # an expired or invalid token means starting again
+                logger.warning(f'Unable to read the changes feed, listing the folders again: {error}')
+                self.full_refresh()
+        self.save()
+        return self
+
+    def full_refresh(self):
+        # take the token first, so that changes made while the folders are listed are applied next time
+        page_token = self.drive.start_page_token()
+        files = {}
+        for folder_id in self.folder_ids:
+            for file in self.drive.iter_folder(folder_id, self.fields):
+                files[file['id']] = file
+        self.files = files
+        self.page_token = page_token
+        logger.info(f'Listed {len(files)} files in {len(self.folder_ids)} folders')
+
+    def apply_changes(self):
+        changes, self.page_token = self.drive.changes(self.page_token, self.fields)
+        for change in changes:
+            file = change.get('file')
+            if change.get('removed') or not file or file.get('trashed') or not self.in_folders(file):
+                self.files.pop(change['fileId'], None)
+            else:
+                file.setdefault('id', change['fileId'])
+                self.files[change['fileId']] = file
+        logger.info(f'Applied {len(changes)} changes, {len(self.files)} files')
+
+    def in_folders(self, file):
+        return any(parent in self.folder_ids for parent in file.get('parents', []))
+
+    def in_folder(self, folder_id):
+        """Return the files in one of the folders."""
+        return [file for file in self.files.values() if folder_id in file.get('parents', [])]
+
+    def by_name(self):
+        """Return {file name: [files with that name]}."""
+        rv = {}
+        for file in self.files.values():
+            rv.setdefault(file.get('name', ''), []).append(file)
+        return rv
+
+    def name_index(self):
+        """Return {file name: file id}; a name shared by several files maps to the most recently modified one."""
+        rv = {}
+        for name, files in self.by_name().items():
+            if len(files) > 1:
+                logger.warning(f'{len(files)} files are called {name}')
+            rv[name] = max(files, key=lambda file: file.get('modifiedTime', ''))['id']
+        return rv
+
+    def locations(self):
+        """Return {file name: (file id, folder id)}, choosing among files with the same name as name_index does."""
+        rv = {}
+        for name, files in self.by_name().items():
+            file = max(files, key=lambda file: file.get('modifiedTime', ''))
+            folder_id = next((parent for parent in file.get('parents', []) if parent in self.folder_ids), None)
+            rv[name] = (file['id'], folder_id)
+        return rv
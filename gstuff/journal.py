@@ -0,0 +1,60 @@
+import json
+import logging
+import os
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_JOURNAL_FILE = '.vs_journal.jsonl'
+
+
+class Journal:
+    """An append-only log of completed steps, one JSON object per line, for resuming a run that stopped part way.
+
+    Each record() writes one short line and syncs it to disk, which is cheap next to the API call that completed
+    the step, so a crash loses at most the step that was in progress. A line left incomplete by a crash is ignored
+    when the journal is read.
+    """
+
+    def __init__(self, path, resume=False):
+        """Start a new journal at "path", or with "resume" read the existing one and add to it."""
+        self.path = path
+        self.entries = self.read(path) if resume else []
+        self._lock = threading.Lock()
+        self._file = open(path, 'a' if resume else 'w', encoding='utf-8')
+
+    @staticmethod
+    def read(path):
+        entries = []
+        try:
+            with open(path, encoding='utf-8') as f:
+                for line_number, line in enumerate(f, 1):
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        logger.warning(f'Ignoring line {line_number} of {path}, it is incomplete')
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def record(self, step, **fields):
+        entry = {'step': step, 'time': time.time(), **fields}
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.entries.append(entry)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,103 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_MANIFEST_FILE = '.vs_manifest.json'
+
+
+def content_hash(sheet, columns, config=None):
+    """Return a hash of the given columns of a sheet, and of "config" (anything JSON serializable, e.g. the settings
+    the outputs are generated with, so that changing them also changes the hash)."""
+    digest = hashlib.sha256()
+    digest.update(json.dumps(config, sort_keys=True).encode('utf-8'))
+    for col in sorted(set(columns)):
+        digest.update(json.dumps([col, list(sheet.get_col(col))]).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class Manifest:
+    """A record of the files generated from each tab of each source workbook.
+
+    For every (source file id, tab name) the manifest keeps the content hash of the tab when its outputs were last
+    generated, the {filename: file id} of those outputs and the {filename: folder id} of the folders they were written
+    to, so a later run can skip tabs that have not changed and update the files of the ones that have (moving them if
+    they now belong in another folder) instead of creating new ones. It is saved as JSON at "path".
+    """
+
+    def __init__(self, path=DEFAULT_MANIFEST_FILE):
+        self.path = path
+        self.sources = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                self.sources = json.load(f).get('sources', {})
+        except FileNotFoundError:
+            self.sources = {}
+        except (OSError, ValueError) as error:
+            logger.warning(f'Unable to read the manifest {self.path}, starting a new one: {error}')
+            self.sources = {}
+
+    def save(self):
+        with self._lock:
+            tmp_path = f'{self.path}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump({'sources': self.sources}, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+
+    def entry(self, file_id, tab):
+        with self._lock:
+            return self.sources.get(file_id, {}).get(tab)
+
+    def unchanged(self, file_id, tab, tab_hash):
+        """Return True if the outputs of the tab were all generated from content with this hash."""
+        entry = self.entry(file_id, tab)
+        return entry is not None and entry.get('hash') == tab_hash and bool(entry.get('outputs'))
+
+    def outputs(self, file_id, tab):
+        """Return {filename: file id} of the files last generated from the tab."""
+        entry = self.entry(file_id, tab)
+        return dict(entry.get('outputs', {})) if entry else {}
+
+    def locations(self, file_id, tab):
+        """Return {filename: (file id, folder id)} of the files last generated from the tab; the folder is None if it
+        was not recorded."""
+        entry = self.entry(file_id, tab)
+        if not entry:
+            return {}
+        folders = entry.get('folders', {})
+        return {filename: (output_id, folders.get(filename)) for filename, output_id in entry.get('outputs', {}).items()}
+
+    def record(self, file_id, tab, tab_hash, outputs, folders=None):
+        """Record the outputs generated from the tab, and the {filename: folder id} they were written to. With a
+        "tab_hash" they are all of the tab's outputs and replace the ones recorded before, so outputs the tab no
+        longer generates are dropped. Pass None for "tab_hash" if not all of them could be generated; they are then
+        added to the ones recorded before, and the tab is generated again next time (updating the outputs recorded
+        here)."""
+        with self._lock:
+            entry = self.sources.setdefault(file_id, {}).setdefault(tab, {'hash': None, 'outputs': {}})
+            entry['hash'] = tab_hash
+            if tab_hash is not None:
+                entry['outputs'] = dict(outputs)
+                entry['folders'] = dict(folders or {})
+            else:
+                entry['outputs'].update(outputs)
+                entry.setdefault('folders', {}).update(folders or {})
+
+    def forget(self, file_id, tab, filenames):
+        """Drop outputs of the tab that no longer exist, so that they are generated as new files next time."""
+        with self._lock:
+            entry = self.sources.get(file_id, {}).get(tab)
+            if not entry:
+                return
+            for filename in filenames:
+                entry['outputs'].pop(filename, None)
+                entry.get('folders', {}).pop(filename, None)
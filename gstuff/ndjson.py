@@ -0,0 +1,150 @@
+from gstuff.vocabulary import Concept
+from gstuff.vocabulary import MemberStore
+from gstuff.vocabulary import Term
+from gstuff.vocabulary import ValueSet
+from gstuff.vocabulary import VSReference
+import json
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+# Value sets are written as newline-delimited JSON. Each value set is a header line, with every attribute except the
+# members, followed by lines holding chunks of its members:
+#
+#   {"type": "value_set", "label": ..., "subsets": [...], ..., "member_count": 2}
+#   {"type": "members", "members": [["", "Asthma", "195967001", "SNOMED", ""], ...]}
+#
+# A member is [handle, label, code, system, note], with a sixth item [[label, context], ...] if it has terms.
+
+DEFAULT_CHUNK_SIZE = 1000
+
+HEADER_FIELDS = ('label', 'handle', 'kind', 'concept', 'description', 'oid', 'uri', 'namespaces', 'intent',
+                 'documentation', 'info', 'errors', 'gs_kind')
+
+
+def member_rows(members):
+    """ yield the members as rows: [handle, label, code, system, note] plus [[label, context], ...] if it has terms """
+    if isinstance(members, MemberStore):
+        rows = members.rows()
+    else:
+        # read the terms without creating empty lists for the members that have none
+        rows = ((c.handle, c.label, c.code, c.system, c.note, c._terms) for c in members)
+    for handle, label, code, system, note, terms in rows:
+        row = [handle, label, code, system, note]
+        if terms:
+            row.append([[term.label, term.context] for term in terms])
+        yield row
+
+
+def terms_from_row(row):
+    terms = []
+    for label, context in row[5]:
+        term = Term()
+        term.label = label
+        term.context = context
+        terms.append(term)
+    return terms
+
+
+def add_member_rows(vs, rows):
+    members = vs.members
+    if isinstance(members, MemberStore):
+        for row in rows:
+            members.add(*row[:5], terms_from_row(row) if len(row) > 5 else None)
+        return
+    for row in rows:
+        concept = Concept()
+        concept.handle, concept.label, concept.code, concept.system, concept.note = row[:5]
+        if len(row) > 5:
+            concept.terms = terms_from_row(row)
+        members.append(concept)
+
+
+def _line(record):
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+def dump_value_sets(value_sets, fp, chunk_size=DEFAULT_CHUNK_SIZE):
+    """ write value sets to the text file "fp", one at a time, and return how many were written
+
+        "value_sets" can be any iterable, e.g. a generator that loads them one by one, so the whole library never has
+        to be in memory.
+    """
+    count = 0
+    for vs in value_sets:
+        header = {'type': 'value_set'}
+        for name in HEADER_FIELDS:
+            header[name] = getattr(vs, name)
+        header['subsets'] = [ref.to_dict() for ref in vs.subsets]
+        header['member_count'] = len(vs.members)
+        fp.write(_line(header))
+        chunk = []
+        for row in member_rows(vs.members):
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                fp.write(_line({'type': 'members', 'members': chunk}))
+                chunk = []
+        if chunk:
+            fp.write(_line({'type': 'members', 'members': chunk}))
+        count += 1
+    return count
+
+
+def write_value_sets(path, value_sets, chunk_size=DEFAULT_CHUNK_SIZE):
+    """ write value sets to a new NDJSON file at "path" and return how many were written """
+    with open(path, 'w', encoding='utf-8') as fp:
+        count = dump_value_sets(value_sets, fp, chunk_size)
+    logger.info(f'Wrote {count} value sets to {path}')
+    return count
+
+
+def value_set_from_header(header):
+    vs = ValueSet()
+    for name in HEADER_FIELDS:
+        if name in header:
+            setattr(vs, name, header[name])
+    vs.subsets = [VSReference(ref['label'], ref['short_name'], ref['note']) for ref in header.get('subsets', [])]
+    return vs
+
+
+def load_value_sets(fp, compact=False):
+    """ yield the value sets in the NDJSON text file "fp" one at a time, reading one line at a time
+
+        With "compact" each value set's members are kept in a MemberStore (see ValueSet.compact).
+    """
+    vs = None
+    for line_number, line in enumerate(fp, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f'Line {line_number} is not valid JSON: {e}') from None
+        kind = record.get('type')
+        if kind == 'value_set':
+            if vs is not None:
+                yield vs
+            vs = value_set_from_header(record)
+            if compact:
+                vs.compact()
+        elif kind == 'members':
+            if vs is None:
+                raise ValueError(f'Line {line_number} has members before any value set')
+            add_member_rows(vs, record['members'])
+        else:
+            raise ValueError(f'Line {line_number} has an unknown record type: {kind!r}')
+    if vs is not None:
+        yield vs
+
+
+def iter_value_sets(path, compact=False):
+    """ yield the value sets in the NDJSON file at "path" one at a time """
+    with open(path, encoding='utf-8') as fp:
+        yield from load_value_sets(fp, compact)
+
+
+def read_value_sets(path, compact=False):
+    """ return a list of all of the value sets in the NDJSON file at "path" """
+    return list(iter_value_sets(path, compact))
@@ -0,0 +1,236 @@
+from gstuff.vocabulary import ValueSet
+import itertools
+import random
+
+
+# a Mersenne prime larger than any member id, for the MinHash hash function
+MINHASH_PRIME = (1 << 61) - 1
+# value sets with fewer members than this are compared exactly by approximate_overlaps
+EXACT_BELOW = 20
+
+
+def vs_name(vs: ValueSet):
+    return vs.info.get('short_name') or vs.label or vs.handle
+
+
+class Corpus:
+    """ a collection of value sets with their members encoded as integer ids
+
+        Every distinct (system, code) in the collection gets an id, and each value set is stored as a sorted list of
+        ids and as a bitset (a Python int with bit i set for member id i), so intersections are a single AND and a
+        bit count.
+    """
+
+    def __init__(self, value_sets=None):
+        self.ids = {}
+        self.names = []
+        self.members = []
+        self.bitsets = []
+        for vs in value_sets or []:
+            self.add(vs)
+
+    def __len__(self):
+        return len(self.names)
+
+    def encode(self, vs: ValueSet):
+        ids = self.ids
+        encoded = set()
+        for concept in vs.members:
+            key = concept.system, concept.code
+            member_id = ids.get(key)
+            if member_id is None:
+                member_id = ids[key] = len(ids)
+            encoded.add(member_id)
+        return sorted(encoded)
+
+    def add(self, vs: ValueSet, name=None):
+        members = self.encode(vs)
+        bits = bytearray((members[-1] >> 3) + 1 if members else 0)
+        for member_id in members:
+            bits[member_id >> 3] |= 1 << (member_id & 7)
+        bitset = int.from_bytes(bits, 'little')
+        self.names.append(name or vs_name(vs))
+        self.members.append(members)
+        self.bitsets.append(bitset)
+
+    def size(self, i):
+        return len(self.members[i])
+
+    def candidate_pairs(self, among=None):
+        """ return the pairs (i, j), i < j, of value sets that share at least one member, from an inverted index;
+            with "among" (a collection of value set indexes) only the pairs with at least one of them in it """
+        postings = {}
+        for i, members in enumerate(self.members):
+            for member_id in members:
+                postings.setdefault(member_id, []).append(i)
+        pairs = set()
+        if among is not None:
+            for i in among:
+                for member_id in self.members[i]:
+                    pairs.update((min(i, j), max(i, j)) for j in postings[member_id] if j != i)
+            return pairs
+        for sets in postings.values():
+            if len(sets) > 1:
+                pairs.update(itertools.combinations(sets, 2))
+        return pairs
+
+    def overlap(self, i, j, estimated=False):
+        return Overlap(self, i, j, (self.bitsets[i] & self.bitsets[j]).bit_count(), estimated)
+
+
+class Overlap:
+    """ the overlap of two value sets in a Corpus """
+
+    def __init__(self, corpus, i, j, intersection, estimated=False):
+        self.first = corpus.names[i]
+        self.second = corpus.names[j]
+        self.first_size = corpus.size(i)
+        self.second_size = corpus.size(j)
+        self.intersection = intersection
+        self.estimated = estimated
+
+    @property
+    def union(self):
+        return self.first_size + self.second_size - self.intersection
+
+    @property
+    def jaccard(self):
+        return self.intersection / self.union if self.union else 0.0
+
+    @property
+    def containment(self):
+        """ the fraction of the smaller value set that is also in the larger one """
+        smaller = min(self.first_size, self.second_size)
+        return self.intersection / smaller if smaller else 0.0
+
+    def __str__(self):
+        return (f'{self.jaccard:.3f} jaccard, {self.containment:.3f} containment, {self.intersection} shared: '
+                f'{self.first} ({self.first_size}) / {self.second} ({self.second_size})')
+
+
+def rank(overlaps, min_jaccard=0.0, min_containment=0.0):
+    """ return the overlaps at or above the thresholds, the most similar first """
+    selected = [o for o in overlaps if o.jaccard >= min_jaccard and o.containment >= min_containment]
+    selected.sort(key=lambda o: (-o.jaccard, -o.containment, o.first, o.second))
+    return selected
+
+
+def exact_overlaps(corpus: Corpus, min_jaccard=0.0, min_containment=0.0):
+    """ return the exact overlap of every pair of value sets that share at least one member, ranked """
+    overlaps = [corpus.overlap(i, j) for i, j in corpus.candidate_pairs()]
+    return rank(overlaps, min_jaccard, min_containment)
+
+
+class MinHash:
+    """ one-permutation MinHash signatures of integer id sets, and LSH banding to find the pairs likely to be similar
+
+        Each member is hashed once and the hash is split into a bin (one of bands * rows) and a value; the signature
+        is the smallest value in each bin. A set with fewer members than bins leaves most bins empty, so each empty
+        bin is filled from a non-empty one found by probing the bins in a fixed pseudo-random order for that bin
+        (optimal densification); the order is the same for every set, so two similar sets fill their empty bins
+        from the same bins and the fraction of bins that two signatures agree on estimates their Jaccard
+        similarity however small the sets are. With "bands" bands of "rows" bins each, a
+        pair with similarity s becomes a candidate with probability of about 1 - (1 - s ** rows) ** bands; the
+        threshold where that is one half is about (1 / bands) ** (1 / rows).
+    """
+
+    EMPTY = MINHASH_PRIME
+
+    def __init__(self, bands=32, rows=4, seed=0):
+        self.bands = bands
+        self.rows = rows
+        self.bins = bands * rows
+        rng = random.Random(seed)
+        self.a = rng.randrange(1, MINHASH_PRIME)
+        self.b = rng.randrange(0, MINHASH_PRIME)
+        # the probe order of each bin, extended as far as it is needed
+        self._probe_a = rng.randrange(1, MINHASH_PRIME)
+        self._probe_b = rng.randrange(0, MINHASH_PRIME)
+        self._probes = [[] for _ in range(self.bins)]
+
+    def probes(self, bin_index):
+        """ yield the bins to take a value from when "bin_index" is empty, in order """
+        probes = self._probes[bin_index]
+        attempt = 0
+        while True:
+            if attempt == len(probes):
+                x = bin_index << 32 | attempt
+                probes.append((self._probe_a * x + self._probe_b) % MINHASH_PRIME % self.bins)
+            yield probes[attempt]
+            attempt += 1
+
+    @property
+    def threshold(self):
+        return (1 / self.bands) ** (1 / self.rows)
+
+    def signature(self, members):
+        if not members:
+            return None
+        a, b, p, bins = self.a, self.b, MINHASH_PRIME, self.bins
+        signature = [self.EMPTY] * bins
+        for x in members:
+            value, bin_index = divmod((a * x + b) % p, bins)
+            if value < signature[bin_index]:
+                signature[bin_index] = value
+        empty = self.EMPTY
+        if empty in signature:
+            filled = list(signature)
+            for bin_index, value in enumerate(signature):
+                if value == empty:
+                    for donor in self.probes(bin_index):
+                        if signature[donor] != empty:
+                            filled[bin_index] = signature[donor]
+                            break
+            signature = filled
+        return tuple(signature)
+
+    def candidate_pairs(self, signatures):
+        pairs = set()
+        for band in range(self.bands):
+            start = band * self.rows
+            buckets = {}
+            for i, signature in enumerate(signatures):
+                if signature is not None:
+                    buckets.setdefault(signature[start:start + self.rows], []).append(i)
+            for sets in buckets.values():
+                if len(sets) > 1:
+                    pairs.update(itertools.combinations(sets, 2))
+        return pairs
+
+    @staticmethod
+    def similarity(first, second):
+        if not first:
+            return 0.0
+        return sum(x == y for x, y in zip(first, second)) / len(first)
+
+
+def approximate_overlaps(corpus: Corpus, min_jaccard=0.5, min_containment=0.0, minhash=None, verify=True,
+                         exact_below=EXACT_BELOW):
+    """ return the overlaps of the pairs that are probably at least "min_jaccard" similar, ranked
+
+        Candidates are found with MinHash LSH rather than by comparing every pair. With "verify" (the default) their
+        overlap is then counted exactly from the bitsets, otherwise it is estimated from the signatures. The
+        signatures of sets with only a few members are too coarse for banding to find them reliably, so the pairs
+        that include a set of fewer than "exact_below" members are found from the inverted index and counted exactly.
+    """
+    minhash = minhash or MinHash()
+    small = [i for i in range(len(corpus)) if corpus.size(i) < exact_below]
+    small_set = set(small)
+    signatures = [None if i in small_set else minhash.signature(members) for i, members in enumerate(corpus.members)]
+    exact = corpus.candidate_pairs(small) if small else set()
+    overlaps = [corpus.overlap(i, j) for i, j in exact]
+    for i, j in minhash.candidate_pairs(signatures):
+        if verify:
+            overlaps.append(corpus.overlap(i, j))
+        else:
+            # estimate the intersection from the estimated Jaccard similarity: |A & B| = s (|A| + |B|) / (1 + s)
+            s = MinHash.similarity(signatures[i], signatures[j])
+            intersection = min(round(s * (corpus.size(i) + corpus.size(j)) / (1 + s)), corpus.size(i), corpus.size(j))
+            overlaps.append(Overlap(corpus, i, j, intersection, estimated=True))
+    return rank(overlaps, min_jaccard, min_containment)
+
+
+def overlap_report(overlaps, limit=None):
+    """ return the ranked overlaps as lines of text """
+    lines = [str(o) + (' (estimated)' if o.estimated else '') for o in overlaps[:limit]]
+    return lines or ['No overlapping value sets.']
@@ -0,0 +1,310 @@
+from concurrent.futures import ThreadPoolExecutor
+from gstuff.clients import get_pool
+from gstuff.inventory import FolderInventory
+from gstuff.validate import Table
+from gstuff.validate import Validator
+from gstuff.validate import missing_columns
+from gstuff.vocabulary import value_set_from_gs
+from googleapiclient.errors import HttpError
+import json
+import logging
+import os
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_INDEX_FILE = '.ref_index.json'
+DEFAULT_PREFIXES = ('nvdnc-ns::',)
+SPREADSHEET_MIME_TYPE = 'application/vnd.google-apps.spreadsheet'
+
+# the kinds of things that are defined and referred to
+DATA_VARIABLE = 'data variable'
+STATEMENT = 'statement'
+CRITERION = 'criterion'
+VALUE_SET = 'value set'
+
+
+class SheetSource:
+    """The handles defined and referred to in one tab of a workbook.
+
+    Every data row of "table" (a gstuff.validate.Table) defines the handle in its "handle" column as a thing of
+    "kind", and refers to the handle in each column of "references", a list of (column, kind of the thing referred to).
+    """
+
+    def __init__(self, file_id, table, kind, handle, references=()):
+        self.file_id = file_id
+        self.table = table
+        self.kind = kind
+        self.handle = handle
+        self.references = list(references)
+
+    @property
+    def source_id(self):
+        return f'{self.file_id}/{self.table.name}'
+
+    def read(self, workbook):
+        """Return the ([kind, name] definitions, [kind, name, referrer kind, referrer, location] references) of the
+        tab in a loaded workbook."""
+        validator = Validator(workbook)
+        sheet = validator.sheet(self.table)
+        if sheet is None:
+            logger.warning(f'Sheet {self.table.name} not found in {workbook.name or self.file_id}')
+            return [], []
+        columns = [self.handle] + [col for col, _ in self.references]
+        missing = missing_columns(sheet, columns + self.table.columns())
+        if missing:
+            logger.warning(f'Columns {missing} not found in sheet {self.table.name}, they are left out of the index')
+            if self.handle in missing or missing_columns(sheet, self.table.columns()):
+                return [], []
+        references = [(col, kind) for col, kind in self.references if col not in missing]
+        definitions = []
+        refs = []
+        for row, values, _ in validator.rows(sheet, self.table, [self.handle] + [col for col, _ in references]):
+            handle = values[self.handle]
+            location = f'{self.table.name}!{row + 1}'
+            if handle:
+                definitions.append([self.kind, handle])
+            for col, kind in references:
+                if values[col]:
+                    refs.append([kind, values[col], self.kind, handle, location])
+        return definitions, refs
+
+
+def default_sheet_sources(statement_sheet_id, criterion_sheet_id):
+    """The data variables and statements in the Statements workbook and the criteria in the Criteria workbook, given
+    by their file ids. The criteria refer to their statement by the handle in the column with the data name
+    'statement'; the Criteria sheet has no directive column, so all of its rows are indexed."""
+    data_variables = Table('Data Variables', first_row=3, directive=0)
+    statements = Table('Statements', first_row=3, directive=0)
+    criteria = Table('Criteria', first_row=3, data_name_row=1, directive=None)
+    return [
+        SheetSource(statement_sheet_id, data_variables, DATA_VARIABLE, 1),
+        SheetSource(statement_sheet_id, statements, STATEMENT, 3, [(6, DATA_VARIABLE)]),
+        SheetSource(criterion_sheet_id, criteria, CRITERION, 'handle', [('statement', STATEMENT)]),
+    ]
+
+
+def file_version(file):
+    return str(file.get('version') or file.get('modifiedTime') or '') or None
+
+
+class ReferenceIndex:
+    """An index of the handles defined in a set of sources and of the references between them.
+
+    A source is a tab of a workbook (a SheetSource) or a value set file in the value set folders. Each source
+    contributes definitions (kind, name) and references from one of its things to a (kind, name), and the index keeps,
+    for every (kind, name), the sources that define it and the things that refer to it, plus the set of those that
+    are referred to but not defined anywhere. So "who refers to X" and "is X dangling" are single lookups, and a
+    sweep of the dangling references only visits the ones that are.
+
+    Names are compared without any of "prefixes", so a handle given without its namespace matches the full handle.
+    Sources are updated one at a time: refresh() asks Drive for the version of each workbook and of each file in the
+    value set folders (through the changes feed of a FolderInventory) and only reads the ones that changed. With a
+    "path" the sources are saved there, and the rest of the index is rebuilt from them when it is loaded.
+    """
+
+    def __init__(self, path=None, prefixes=DEFAULT_PREFIXES):
+        self.path = path
+        self.prefixes = tuple(prefixes)
+        self.sources = {}
+        self.definitions = {}
+        self.referrers = {}
+        self.dangling = set()
+        self._lock = threading.Lock()
+        if path:
+            self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as error:
+            logger.warning(f'Unable to read the reference index {self.path}, starting a new one: {error}')
+            return
+        if tuple(saved.get('prefixes', ())) != self.prefixes:
+            return
+        for source_id, source in saved.get('sources', {}).items():
+            self.update_source(source_id, source['version'], source['definitions'], source['references'],
+                               source.get('folder', False))
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            tmp_path = f'{self.path}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump({'prefixes': self.prefixes, 'sources': self.sources}, f)
+            os.replace(tmp_path, self.path)
+
+    def key(self, kind, name):
+        for prefix in self.prefixes:
+            if name.startswith(prefix):
+                name = name[len(prefix):]
+                break
+        return kind, name
+
+    def update_source(self, source_id, version, definitions, references, folder=False):
+        """Replace what a source contributes to the index. "folder" marks a file from the value set folders."""
+        with self._lock:
+            self._remove(source_id)
+            self.sources[source_id] = {'version': version, 'definitions': definitions, 'references': references,
+                                       'folder': folder}
+            for kind, name in definitions:
+                defined_in = self.definitions.setdefault(self.key(kind, name), {})
+                defined_in[source_id] = defined_in.get(source_id, 0) + 1
+                self.dangling.discard(self.key(kind, name))
+            for kind, name, referrer_kind, referrer, location in references:
+                key = self.key(kind, name)
+                self.referrers.setdefault(key, set()).add((source_id, referrer_kind, referrer, location))
+                if key not in self.definitions:
+                    self.dangling.add(key)
+
+    def remove_source(self, source_id):
+        with self._lock:
+            self._remove(source_id)
+
+    def _remove(self, source_id):
+        source = self.sources.pop(source_id, None)
+        if source is None:
+            return
+        for kind, name in source['definitions']:
+            key = self.key(kind, name)
+            defined_in = self.definitions.get(key)
+            if defined_in is None or source_id not in defined_in:
+                continue
+            defined_in[source_id] -= 1
+            if not defined_in[source_id]:
+                del defined_in[source_id]
+            if not defined_in:
+                del self.definitions[key]
+                if key in self.referrers:
+                    self.dangling.add(key)
+        for kind, name, referrer_kind, referrer, location in source['references']:
+            key = self.key(kind, name)
+            referrers = self.referrers.get(key)
+            if referrers is None:
+                continue
+            referrers.discard((source_id, referrer_kind, referrer, location))
+            if not referrers:
+                del self.referrers[key]
+                self.dangling.discard(key)
+
+    def is_defined(self, kind, name):
+        return self.key(kind, name) in self.definitions
+
+    def defined_in(self, kind, name):
+        """Return the ids of the sources that define a thing."""
+        return sorted(self.definitions.get(self.key(kind, name), ()))
+
+    def who_references(self, kind, name):
+        """Return the (source id, referrer kind, referrer, location) of every reference to a thing."""
+        return sorted(self.referrers.get(self.key(kind, name), ()))
+
+    def is_dangling(self, kind, name):
+        return self.key(kind, name) in self.dangling
+
+    def dangling_references(self):
+        """Return [(kind, name, [(source id, referrer kind, referrer, location)])] for every thing that is referred to
+        but not defined."""
+        with self._lock:
+            return [(kind, name, sorted(self.referrers[kind, name])) for kind, name in sorted(self.dangling)]
+
+    def duplicates(self):
+        """Return {(kind, name): {source id: count}} for the things defined more than once."""
+        with self._lock:
+            return {key: dict(defined_in) for key, defined_in in self.definitions.items()
+                    if sum(defined_in.values()) > 1}
+
+    def refresh_sheets(self, pool, sources, cache=None):
+        """Read the SheetSources of the workbooks that changed since they were last read, and drop the tabs that are no
+        longer among "sources"."""
+        current = {source.source_id for source in sources}
+        for source_id in [source_id for source_id, source in self.sources.items() if not source.get('folder')]:
+            if source_id not in current:
+                self.remove_source(source_id)
+        drive = pool.drive()
+        by_file = {}
+        for source in sources:
+            by_file.setdefault(source.file_id, []).append(source)
+        for file_id, file_sources in by_file.items():
+            metadata = drive.get_metadata(file_id)
+            if metadata is None:
+                continue
+            version = file_version(metadata)
+            stale = [source for source in file_sources
+                     if version is None or self.sources.get(source.source_id, {}).get('version') != version]
+            if not stale:
+                continue
+            workbook = pool.gsm().get_workbook(file_id, bulk=True, cache=cache)
+            if not workbook.name:
+                continue
+            for source in stale:
+                definitions, references = source.read(workbook)
+                self.update_source(source.source_id, version, definitions, references)
+            logger.info(f'Indexed {len(stale)} tabs of {workbook.name}')
+
+    def read_value_set(self, pool, file, cache=None):
+        workbook = pool.gsm().get_workbook(file['id'], bulk=True, cache=cache)
+        if not workbook.name:
+            return None
+        vs = value_set_from_gs(workbook)
+        definitions = [[VALUE_SET, file['name']]]
+        references = [[VALUE_SET, ref.short_name, VALUE_SET, file['name'], file['name']]
+                      for ref in vs.subsets if ref.short_name]
+        return definitions, references
+
+    def refresh_value_sets(self, pool, inventory, cache=None, workers=8):
+        """Read the value set files that are new or changed since they were last read, and drop the ones that are no
+        longer in the folders of "inventory" (a FolderInventory, brought up to date here)."""
+        files = {file_id: file for file_id, file in inventory.refresh().files.items()
+                 if file.get('mimeType', SPREADSHEET_MIME_TYPE) == SPREADSHEET_MIME_TYPE}
+        for source_id in [source_id for source_id, source in self.sources.items() if source.get('folder')]:
+            if source_id not in files:
+                self.remove_source(source_id)
+        stale = [file for file_id, file in files.items()
+                 if file_version(file) is None or self.sources.get(file_id, {}).get('version') != file_version(file)]
+        if not stale:
+            return
+        with ThreadPoolExecutor(workers) as executor:
+            futures = {executor.submit(self.read_value_set, pool, file, cache): file for file in stale}
+            for future, file in futures.items():
+                # a file that cannot be read keeps what it contributed before, and is read again next time
+                try:
+                    result = future.result()
+                except HttpError as error:
+                    logger.warning(f'Unable to read value set {file.get("name")} ({file["id"]}): {error}')
+                    continue
+                except ValueError as error:
+                    # e.g. an Info-details-json row that is not valid JSON
+                    logger.warning(f'Unable to parse value set {file.get("name")} ({file["id"]}): {error}')
+                    continue
+                if result is not None:
+                    self.update_source(file['id'], file_version(file), *result, folder=True)
+        logger.info(f'Indexed {len(stale)} value set files')
+
+    def refresh(self, pool=None, sources=(), inventory=None, cache=None, workers=8, folder_ids=()):
+        """Bring the index up to date with the sheet sources (e.g. those of default_sheet_sources()) and the value
+        set folders, either "inventory" (a FolderInventory) or the folders "folder_ids" (e.g. the staging and
+        intensional folders), save it and return it."""
+        pool = pool or get_pool()
+        self.refresh_sheets(pool, sources, cache)
+        if inventory is None and folder_ids:
+            # the listing of the folders is kept next to the index, so it is brought up to date from the changes feed
+            inventory = FolderInventory(pool.drive(), folder_ids, path=f'{self.path}.folders' if self.path else None)
+        if inventory is not None:
+            self.refresh_value_sets(pool, inventory, cache, workers)
+        self.save()
+        return self
+
+
+def print_dangling(index):
+    dangling = index.dangling_references()
+    if not dangling:
+        print('No dangling references found.')
+    for kind, name, referrers in dangling:
+        for source_id, referrer_kind, referrer, location in referrers:
+            print(f'{kind.capitalize()} not found: {name}, referred to by {referrer_kind} {referrer} ({location})')
@@ -0,0 +1,279 @@
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+class Issue:
+    """A problem found by a rule: in a row of a sheet (0-based "row"), or in the sheet as a whole when "row" is None.
+    "key" is the value of the row's key column (e.g. its handle), to make the row easier to find."""
+
+    def __init__(self, rule, sheet, row, message, column=None, value=None, key=None):
+        self.rule = rule
+        self.sheet = sheet
+        self.row = row
+        self.message = message
+        self.column = column
+        self.value = value
+        self.key = key
+
+    def to_dict(self):
+        return {'rule': self.rule, 'sheet': self.sheet, 'row': self.row, 'message': self.message,
+                'column': self.column, 'value': self.value, 'key': self.key}
+
+    def __str__(self):
+        if self.row is None:
+            return f'Sheet: {self.sheet}, {self.message}'
+        text = f'Sheet: {self.sheet}, Row: {self.row + 1}, {self.message}'
+        if self.key:
+            text += f', Handle: {self.key}'
+        return text
+
+    def __repr__(self):
+        return f'Issue({self})'
+
+
+class Table:
+    """The data rows of a sheet that rules are checked against.
+
+    The data rows start at "first_row". Most rules are only checked against the active ones, whose "directive" column
+    holds one of "active" (all of them if "directive" is None); see Rule.all_rows. Columns are given by 0-based index
+    or by data name, the names in row "data_name_row" (see Sheet.get_cell). "key" is the column that identifies a row
+    in issues. With a "workbook" the sheet is read from it rather than from the workbook being validated.
+    """
+
+    def __init__(self, name, first_row=3, data_name_row=-1, directive='directive', active=('ready',), key=None,
+                 workbook=None):
+        self.name = name
+        self.first_row = first_row
+        self.data_name_row = data_name_row
+        self.directive = directive
+        self.active = frozenset(active)
+        self.key = key
+        self.workbook = workbook
+
+    def columns(self):
+        return [col for col in (self.directive, self.key) if col is not None]
+
+
+class Rule:
+    """A check of one or more columns of every data row of a table.
+
+    start() is called before each pass over the rows; it returns the message of an issue that stops the rule from
+    being checked, or None. check() is then called with each row, its 0-based index and its values as {column: value},
+    and returns the message of an issue, or None. Rules only look at each value once, so a whole sheet is checked in
+    one pass. A rule is checked against the active data rows of its table, or with "all_rows" against every data row
+    whatever its directive.
+    """
+
+    name = 'rule'
+    all_rows = False
+
+    def __init__(self, column, all_rows=None):
+        self.column = column
+        if all_rows is not None:
+            self.all_rows = all_rows
+
+    def columns(self):
+        return [self.column]
+
+    def start(self, validator):
+        return None
+
+    def check(self, row, values):
+        return None
+
+
+class Unique(Rule):
+    """No two rows have the same (non-empty) value in "column"."""
+
+    name = 'unique'
+
+    def __init__(self, column, label=None, all_rows=None):
+        super().__init__(column, all_rows)
+        self.label = label or str(column)
+        self._seen = {}
+
+    def start(self, validator):
+        self._seen = {}
+        return None
+
+    def check(self, row, values):
+        value = values[self.column]
+        if not value:
+            return None
+        if value in self._seen:
+            return f'Duplicate {self.label}: {value} (first in row {self._seen[value] + 1})'
+        self._seen[value] = row
+        return None
+
+
+class References(Rule):
+    """Every value in "column" is one of the values of "target_column" in the data rows of the "target" Table, either
+    as it is or with one of "prefixes" added (e.g. 'nvdnc-ns::' for handles given without their namespace)."""
+
+    name = 'references'
+
+    def __init__(self, column, target, target_column, prefixes=(), label=None, all_rows=None):
+        super().__init__(column, all_rows)
+        self.target = target
+        self.target_column = target_column
+        self.prefixes = tuple(prefixes)
+        self.label = label or f'{target_column} of {target.name}'
+        self._values = None
+
+    def start(self, validator):
+        self._values = validator.values(self.target, self.target_column)
+        if self._values is None:
+            return f'Unable to read {self.target_column} of {self.target.name}'
+        return None
+
+    def check(self, row, values):
+        value = values[self.column]
+        if value in self._values:
+            return None
+        if isinstance(value, str) and any(prefix + value in self._values for prefix in self.prefixes):
+            return None
+        return f'{self.label} not found: {value}'
+
+
+class AllowedValues(Rule):
+    """Every value in "column" is one of "allowed", e.g. the directives a sheet may use. Unlike the other rules it is
+    checked against every data row by default, so that rows with a directive that is not allowed are found too."""
+
+    name = 'allowed values'
+    all_rows = True
+
+    def __init__(self, column, allowed, label=None, all_rows=None):
+        super().__init__(column, all_rows)
+        self.allowed = frozenset(allowed)
+        self.label = label or str(column)
+
+    def check(self, row, values):
+        value = values[self.column]
+        if value in self.allowed:
+            return None
+        return f'{self.label} not allowed: {value}'
+
+
+def missing_columns(sheet, columns):
+    """Return the columns (by index or data name) that are not in a sheet."""
+    missing = []
+    for col in dict.fromkeys(columns):
+        if isinstance(col, int) and col >= sheet.cols or isinstance(col, str) and col not in sheet.col_names:
+            missing.append(col)
+    return missing
+
+
+class Validator:
+    """Checks the rules of a set of tables against a workbook, reading each sheet once.
+
+    "checks" is a list of (Table, [Rule]). The values a References rule looks up are indexed in a set once per target
+    column, however many rules and rows use them.
+    """
+
+    def __init__(self, workbook):
+        self.workbook = workbook
+        self._values = {}
+
+    def sheet(self, table):
+        workbook = table.workbook or self.workbook
+        if table.name not in workbook.sheets:
+            return None
+        return workbook.get_sheet(table.name, data_name_row=table.data_name_row)
+
+    def rows(self, sheet, table, columns, all_rows=False):
+        """Yield (row, {column: value}, whether the row is active) for the active data rows of a table's sheet, or
+        with "all_rows" for all of them; the columns must all be in the sheet."""
+        columns = list(dict.fromkeys(columns + table.columns()))
+        data = [sheet.get_col(col) for col in columns]
+        directive = table.directive
+        for row in range(table.first_row, sheet.rows):
+            values = {col: column[row] for col, column in zip(columns, data)}
+            active = directive is None or values[directive] in table.active
+            if active or all_rows:
+                yield row, values, active
+
+    def values(self, table, column):
+        """Return the set of values of a column in the data rows of a table, or None if it cannot be read."""
+        key = (id(table.workbook or self.workbook), table.name, table.first_row, table.data_name_row,
+               table.directive, table.active, column)
+        if key not in self._values:
+            sheet = self.sheet(table)
+            missing = missing_columns(sheet, [column] + table.columns()) if sheet is not None else None
+            if sheet is None or missing:
+                logger.error(f'Unable to read {column} of {table.name}, the sheet or a column is missing')
+                self._values[key] = None
+            else:
+                self._values[key] = {values[column] for _, values, _ in self.rows(sheet, table, [column])}
+        return self._values[key]
+
+    def prefetch(self, checks):
+        """Load all of the sheets to be read from each workbook with as few calls as possible."""
+        names = {}
+        for table, rules in checks:
+            tables = [table] + [rule.target for rule in rules if isinstance(rule, References)]
+            for t in tables:
+                workbook = t.workbook or self.workbook
+                names.setdefault(id(workbook), (workbook, set()))[1].add(t.name)
+        for workbook, sheet_names in names.values():
+            workbook.prefetch(sorted(sheet_names))
+
+    def check(self, table, rules):
+        """Check the rules against the data rows of one table and return the issues found."""
+        issues = []
+        columns = []
+        for rule in rules:
+            columns.extend(rule.columns())
+        sheet = self.sheet(table)
+        if sheet is None:
+            return [Issue('sheet', table.name, None, 'Sheet not found')]
+        # rules on columns that are not in the sheet are reported once and left out of the pass
+        missing = missing_columns(sheet, columns + table.columns())
+        for col in missing:
+            issues.append(Issue('column', table.name, None, f'"{col}" column not found', column=col))
+        missing = set(missing)
+        if missing.intersection(table.columns()):
+            return issues
+        started = []
+        for rule in rules:
+            if missing.intersection(rule.columns()):
+                continue
+            message = rule.start(self)
+            if message is None:
+                started.append(rule)
+            else:
+                issues.append(Issue(rule.name, table.name, None, message, rule.column))
+        rules = started
+        columns = [col for col in columns if col not in missing]
+        all_rows = any(rule.all_rows for rule in rules)
+        for row, values, active in self.rows(sheet, table, columns, all_rows):
+            for rule in rules:
+                if not (active or rule.all_rows):
+                    continue
+                message = rule.check(row, values)
+                if message is not None:
+                    key = values[table.key] if table.key is not None else None
+                    issues.append(Issue(rule.name, table.name, row, message, rule.column, values[rule.column], key))
+        return issues
+
+    def run(self, checks):
+        """Check every (Table, [Rule]) in "checks" and return all of the issues found."""
+        self.prefetch(checks)
+        issues = []
+        for table, rules in checks:
+            issues.extend(self.check(table, rules))
+        return issues
+
+
+def validate(workbook, checks):
+    """Check the rules of "checks", a list of (Table, [Rule]), against a workbook and return the issues found."""
+    return Validator(workbook).run(checks)
+
+
+def print_issues(issues):
+    if issues:
+        for issue in issues:
+            print(issue)
+    else:
+        print('No issues found.')
@@ -1,14 +1,30 @@
+from array import array
 import json
+import sys
 
 
 class Term:
+    __slots__ = ('label', '_context')
 
     def __init__(self):
         self.label: str = ''
         self.context: str = ''
 
+    @property
+    def context(self):
+        return self._context
+
+    @context.setter
+    def context(self, value):
+        # contexts repeat across thousands of terms, so share one copy of each
+        self._context = sys.intern(value) if isinstance(value, str) else value
+
+    def to_dict(self):
+        return {'label': self.label, 'context': self.context}
+
 
 class Concept:
+    __slots__ = ('handle', 'label', 'code', '_system', 'note', '_terms')
 
     def __init__(self):
         self.handle: str = ''
@@ -16,21 +32,179 @@ class Concept:
         self.code: str = ''
         self.system: str = ''
         self.note: str = ''
-        self.terms: list[Term] = []
+        self._terms: list[Term] | None = None
+
+    @property
+    def system(self):
+        return self._system
+
+    @system.setter
+    def system(self, value):
+        self._system = sys.intern(value) if isinstance(value, str) else value
+
+    @property
+    def terms(self):
+        # most concepts have no terms, so the list is only created when it is asked for
+        if self._terms is None:
+            self._terms = []
+        return self._terms
+
+    @terms.setter
+    def terms(self, value):
+        self._terms = value
+
+    def to_dict(self):
+        return {'handle': self.handle, 'label': self.label, 'code': self.code, 'system': self.system,
+                'note': self.note, 'terms': self._terms or []}
+
+    def __str__(self):
+        return f'{self.system}::{self.code}::{self.label}'
+
+
+class MemberStore:
+    """ the members of a value set stored column by column instead of as one Concept object each
+
+        Codes, labels, handles and notes are kept in one list each, systems as indexes into a small table of distinct
+        systems, and terms only for the members that have any. Items are ConceptViews, which read and write the
+        columns like Concept attributes, so a store can stand in for a list of Concepts.
+    """
+    __slots__ = ('handles', 'labels', 'codes', 'system_ids', 'notes', 'terms', 'systems', '_system_index')
+
+    def __init__(self, concepts=()):
+        self.handles: list[str] = []
+        self.labels: list[str] = []
+        self.codes: list[str] = []
+        self.system_ids = array('H')
+        self.notes: list[str] = []
+        self.terms: dict[int, list[Term]] = {}
+        self.systems: list[str] = []
+        self._system_index: dict[str, int] = {}
+        for concept in concepts:
+            self.append(concept)
+
+    def system_id(self, system):
+        system_id = self._system_index.get(system)
+        if system_id is None:
+            system_id = self._system_index[system] = len(self.systems)
+            self.systems.append(sys.intern(system) if isinstance(system, str) else system)
+        return system_id
+
+    def add(self, handle, label, code, system, note, terms=None):
+        """ add a member from its attributes, without a Concept """
+        if terms:
+            self.terms[len(self.codes)] = terms
+        self.handles.append(handle)
+        self.labels.append(label)
+        self.codes.append(code)
+        self.system_ids.append(self.system_id(system))
+        self.notes.append(note)
+
+    def append(self, concept):
+        terms = concept._terms if isinstance(concept, Concept) else concept.terms
+        self.add(concept.handle, concept.label, concept.code, concept.system, concept.note, terms)
+
+    def extend(self, concepts):
+        for concept in concepts:
+            self.append(concept)
+
+    def rows(self):
+        """ yield (handle, label, code, system, note, terms or None) for each member """
+        systems = self.systems
+        for index, row in enumerate(zip(self.handles, self.labels, self.codes, self.system_ids, self.notes)):
+            handle, label, code, system_id, note = row
+            yield handle, label, code, systems[system_id], note, self.terms.get(index)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [ConceptView(self, i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('member index out of range')
+        return ConceptView(self, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield ConceptView(self, index)
+
+    def __bool__(self):
+        return bool(self.codes)
+
+    def concepts(self):
+        """ return the members as a list of Concepts """
+        rv = []
+        for view in self:
+            concept = Concept()
+            concept.handle = view.handle
+            concept.label = view.label
+            concept.code = view.code
+            concept.system = view.system
+            concept.note = view.note
+            concept._terms = self.terms.get(view.index)
+            rv.append(concept)
+        return rv
+
+
+def _store_column(name):
+    def getter(self):
+        return getattr(self.store, name)[self.index]
+
+    def setter(self, value):
+        getattr(self.store, name)[self.index] = value
+    return property(getter, setter)
+
+
+class ConceptView:
+    """ one member of a MemberStore, with the attributes of a Concept """
+    __slots__ = ('store', 'index')
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    handle = _store_column('handles')
+    label = _store_column('labels')
+    code = _store_column('codes')
+    note = _store_column('notes')
+
+    @property
+    def system(self):
+        return self.store.systems[self.store.system_ids[self.index]]
+
+    @system.setter
+    def system(self, value):
+        self.store.system_ids[self.index] = self.store.system_id(value)
+
+    @property
+    def terms(self):
+        return self.store.terms.setdefault(self.index, [])
+
+    def to_dict(self):
+        return {'handle': self.handle, 'label': self.label, 'code': self.code, 'system': self.system,
+                'note': self.note, 'terms': self.store.terms.get(self.index, [])}
 
     def __str__(self):
         return f'{self.system}::{self.code}::{self.label}'
 
 
 class VSReference:
+    __slots__ = ('label', 'short_name', 'note')
 
     def __init__(self, label, short_name, note):
         self.label = label
         self.short_name = short_name
         self.note = note
 
+    def to_dict(self):
+        return {'label': self.label, 'short_name': self.short_name, 'note': self.note}
+
 
 class ValueSet:
+    __slots__ = ('label', 'handle', 'kind', 'concept', 'description', 'oid', 'uri', 'namespaces', 'intent', 'members',
+                 'subsets', 'documentation', 'info', 'errors', 'gs_kind')
 
     def __init__(self):
         self.label: str = ''
@@ -42,7 +216,7 @@ class ValueSet:
         self.uri: str = ''
         self.namespaces: list[str] = []
         self.intent: str = ''
-        self.members: list[Concept] = []
+        self.members: list[Concept] | MemberStore = []
         self.subsets: list[VSReference] = []
         self.documentation: dict = {
             'references': [],
@@ -57,6 +231,17 @@ class ValueSet:
 
         self.gs_kind: str = ''
 
+    def compact(self):
+        """ move the members into a MemberStore, which takes much less memory than a list of Concepts """
+        if not isinstance(self.members, MemberStore):
+            self.members = MemberStore(self.members)
+        return self
+
+    def to_dict(self):
+        rv = {name: getattr(self, name) for name in self.__slots__}
+        rv['members'] = list(self.members)
+        return rv
+
     @property
     def desc_vals(self):
         rv = []
@@ -118,7 +303,8 @@ def values_to_dicts(values):
     return []
 
 
-def value_set_from_gs(gs_wb):
+def value_set_from_gs(gs_wb, compact=False):
+    """ build a ValueSet from a value set workbook; with "compact" its members are kept in a MemberStore """
     vs = ValueSet()
     vs.info['short_name'] = gs_wb.name
     desc_sheet = gs_wb.sheets.get('Description')
@@ -209,12 +395,14 @@ def value_set_from_gs(gs_wb):
             vs.errors.append(f'No content type in file: {gs_wb.name}')
     else:
         vs.errors.append(f'No description sheet in file: {gs_wb.name}')
+    if compact:
+        vs.compact()
     return vs
 
 
 class VocabEncoder(json.JSONEncoder):
 
     def default(self, o):
-        if isinstance(o, ValueSet) or isinstance(o, Concept) or isinstance(o, Term):
-            return o.__dict__
+        if isinstance(o, (ValueSet, Concept, ConceptView, Term, VSReference)):
+            return o.to_dict()
         return json.JSONEncoder.default(self, o)
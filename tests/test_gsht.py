@@ -0,0 +1,15 @@
+from gstuff.executor import RequestExecutor
+from gstuff.fake import FakeGoogle
+from gstuff.gsht import Workbook
+
+
+def test_prefetch_after_get_sheet_names():
+    google = FakeGoogle(latency=0.01)
+    file_id = google.add_spreadsheet('Workbook', {'A': [['a1']], 'B': [['b1']]})
+    executor = RequestExecutor(clock=google.clock.now, sleep=google.clock.sleep)
+    wb = Workbook(file_id, google.sheets_service(), executor=executor)
+    assert wb.get_sheet_names() == ['A', 'B']
+    assert wb.sheet_names() == ['A', 'B']
+    wb.prefetch()
+    assert wb.snapshot() is not None
+    assert wb.get_sheet('B').get_cell(0, 0) == 'b1'
@@ -0,0 +1,63 @@
+from gstuff.overlap import Corpus
+from gstuff.overlap import MinHash
+from gstuff.overlap import approximate_overlaps
+from gstuff.overlap import exact_overlaps
+from gstuff.vocabulary import Concept
+from gstuff.vocabulary import ValueSet
+import random
+
+
+def value_set(name, codes):
+    vs = ValueSet()
+    vs.info['short_name'] = name
+    for code in codes:
+        concept = Concept()
+        concept.code = str(code)
+        concept.system = 'SNOMED'
+        vs.members.append(concept)
+    return vs
+
+
+def near_duplicate_corpus(pairs, size, shared, seed=0):
+    """ a corpus of "pairs" pairs of value sets of "size" members, the two sets of each pair sharing "shared" of
+        them and no set sharing any with another pair """
+    rng = random.Random(seed)
+    codes = iter(rng.sample(range(10 ** 9), pairs * (2 * size - shared)))
+    value_sets = []
+    for n in range(pairs):
+        common = [next(codes) for _ in range(shared)]
+        value_sets.append(value_set(f'a{n}', common + [next(codes) for _ in range(size - shared)]))
+        value_sets.append(value_set(f'b{n}', common + [next(codes) for _ in range(size - shared)]))
+    return Corpus(value_sets)
+
+
+def recall(corpus, min_jaccard, **options):
+    expected = {(o.first, o.second) for o in exact_overlaps(corpus, min_jaccard)}
+    found = {(o.first, o.second) for o in approximate_overlaps(corpus, min_jaccard, **options)}
+    assert expected
+    return len(expected & found) / len(expected)
+
+
+def test_recall_of_near_duplicates():
+    # Jaccard 0.8 to 0.9, from sets that are compared exactly to sets that are only found by banding
+    for size, shared in ((5, 5), (10, 9), (30, 26), (100, 90)):
+        assert recall(near_duplicate_corpus(50, size, shared), 0.75) == 1.0, size
+
+
+def test_recall_of_small_sets_with_signatures_only():
+    # densified signatures find near duplicates even when most of their bins would be empty
+    for size, shared in ((10, 9), (30, 26)):
+        assert recall(near_duplicate_corpus(50, size, shared), 0.75, exact_below=0) >= 0.95, size
+
+
+def test_recall_of_small_loose_overlaps():
+    # 5 members, 3 shared: Jaccard 3 / 7
+    assert recall(near_duplicate_corpus(50, 5, 3), 0.0) == 1.0
+
+
+def test_signature_has_no_empty_bins():
+    minhash = MinHash()
+    signature = minhash.signature([1, 2, 3])
+    assert MinHash.EMPTY not in signature
+    assert minhash.signature([3, 2, 1]) == signature
+    assert minhash.signature([]) is None
@@ -0,0 +1,51 @@
+from gstuff.clients import ClientPool
+from gstuff.executor import RequestExecutor
+from gstuff.fake import FakeCredentials
+from gstuff.fake import FakeGoogle
+from gstuff.refindex import CRITERION
+from gstuff.refindex import DATA_VARIABLE
+from gstuff.refindex import STATEMENT
+from gstuff.refindex import ReferenceIndex
+from gstuff.refindex import default_sheet_sources
+
+
+# the first rows of each sheet are headers; the data starts on row 4
+DATA_VARIABLES = [['Data Variables'], ['directive', 'handle'], [''],
+                  ['ready', 'nvdnc-ns::dv1'],
+                  ['ready', 'nvdnc-ns::dv2']]
+STATEMENTS = [['Statements'], ['directive', '', '', 'handle', 'label', '', 'data variable'], [''],
+              ['ready', '', '', 's1', 'Statement 1', '', 'dv1'],
+              ['ready', '', '', 's2', 'Statement 2', '', 'dv2'],
+              ['draft', '', '', 's3', 'Statement 3', '', 'dv3']]
+# the Criteria sheet has its data names on row 2 and no directive column
+CRITERIA = [['Criteria'], ['handle', 'label', 'statement'], [''],
+            ['c1', 'Criterion 1', 's1'],
+            ['c2', 'Criterion 2', 's9']]
+
+
+def fake_index():
+    google = FakeGoogle(latency=0.01)
+    statement_sheet_id = google.add_spreadsheet('Statements', {'Data Variables': DATA_VARIABLES,
+                                                               'Statements': STATEMENTS})
+    criterion_sheet_id = google.add_spreadsheet('Criteria', {'Criteria': CRITERIA})
+    executor = RequestExecutor(clock=google.clock.now, sleep=google.clock.sleep)
+    pool = ClientPool(credentials=FakeCredentials(), executor=executor, build_service=google.build)
+    sources = default_sheet_sources(statement_sheet_id, criterion_sheet_id)
+    return ReferenceIndex().refresh(pool, sources)
+
+
+def test_criteria_are_indexed():
+    index = fake_index()
+    assert index.is_defined(CRITERION, 'c1')
+    assert index.is_defined(CRITERION, 'c2')
+    assert [referrer for _, _, referrer, _ in index.who_references(STATEMENT, 's1')] == ['c1']
+
+
+def test_dangling_criterion_reference():
+    index = fake_index()
+    dangling = [(kind, name, [(referrer_kind, referrer, location) for _, referrer_kind, referrer, location in referrers])
+                for kind, name, referrers in index.dangling_references()]
+    assert dangling == [(STATEMENT, 's9', [(CRITERION, 'c2', 'Criteria!5')])]
+    # statements that are not ready are left out, so neither they nor their references are indexed
+    assert not index.is_defined(STATEMENT, 's3')
+    assert not index.is_dangling(DATA_VARIABLE, 'dv3')
@@ -0,0 +1,217 @@
+from concurrent.futures import ThreadPoolExecutor
+from gstuff.clients import ClientPool
+from gstuff.executor import RequestExecutor
+from gstuff.fake import FakeCredentials
+from gstuff.fake import FakeGoogle
+from gstuff.fake import SPREADSHEET_MIME_TYPE
+from gstuff.gdrv import MoveQueue
+from gstuff.gsht import GSManager
+from gstuff.manifest import Manifest
+import benchmark
+import googlesheetssettings as gss
+import vs_creator
+import collections
+import pytest
+
+
+# the fake Sheets quota is lifted so that runs are not slowed down by retries
+QUOTAS = {('sheets', 'read'): 10 ** 6, ('sheets', 'write'): 10 ** 6}
+
+
+def fake_backend(tabs=6, rows=10):
+    """ a fake backend with the target folders and a synthetic source workbook; return (google, pool, source id) """
+    google = FakeGoogle(latency=0.01, quotas=QUOTAS)
+    google.add_folder('Staging', file_id=gss.STAGING_FOLDER_ID)
+    google.add_folder('Intensional', file_id=gss.INTENSIONAL_FOLDER_ID)
+    source_id = benchmark.synthetic_source_workbook(google, tabs, rows)
+    executor = RequestExecutor(quotas=QUOTAS, clock=google.clock.now, sleep=google.clock.sleep)
+    pool = ClientPool(credentials=FakeCredentials(), executor=executor, build_service=google.build)
+    return google, pool, source_id
+
+
+def value_set_files(google, source_id):
+    """ the value set files (every spreadsheet but the source workbook) """
+    return [file for file in google.files.values()
+            if file['mimeType'] == SPREADSHEET_MIME_TYPE and file['id'] != source_id and not file['trashed']]
+
+
+def file_named(google, source_id, name):
+    files = [file for file in value_set_files(google, source_id) if file['name'] == name]
+    assert len(files) == 1
+    return files[0]
+
+
+def duplicates(google, source_id):
+    names = collections.Counter(file['name'] for file in value_set_files(google, source_id))
+    return [name for name, count in names.items() if count > 1]
+
+
+def edit_tab(google, source_id, tab):
+    google.sheet(google.file(source_id), tab)['values'][4][3] = 'edited term'
+    google.touch(google.file(source_id))
+
+
+def test_deleted_output_is_created_again(tmp_path, capsys):
+    google, pool, source_id = fake_backend()
+    manifest_path = str(tmp_path / 'manifest.json')
+    vs_creator.main([source_id], pool=pool, manifest_path=manifest_path)
+    grouping = file_named(google, source_id, 'Condition_1_Dx')
+    pool.drive().service.files().delete(fileId=grouping['id']).execute()
+    edit_tab(google, source_id, 'Tab 1')
+    capsys.readouterr()
+
+    vs_creator.main([source_id], pool=pool, manifest_path=manifest_path)
+    assert 'FAILED' not in capsys.readouterr().out
+    grouping = file_named(google, source_id, 'Condition_1_Dx')
+    assert grouping['parents'] == [gss.STAGING_FOLDER_ID]
+    assert Manifest(manifest_path).outputs(source_id, 'Tab 1')['Condition_1_Dx'] == grouping['id']
+
+    # the tab is up to date, so the next run leaves it alone
+    vs_creator.main([source_id], pool=pool, manifest_path=manifest_path)
+    output = capsys.readouterr().out
+    assert 'FAILED' not in output
+    assert '6 tabs unchanged' in output
+    assert not duplicates(google, source_id)
+
+
+def test_upsert_uses_the_folders_rather_than_the_manifest(tmp_path, capsys):
+    google, pool, source_id = fake_backend()
+    manifest_path = str(tmp_path / 'manifest.json')
+    vs_creator.main([source_id], pool=pool, manifest_path=manifest_path)
+    trashed = file_named(google, source_id, 'Condition_2_Dx')
+    pool.drive().service.files().update(fileId=trashed['id'], body={'trashed': True}).execute()
+    edit_tab(google, source_id, 'Tab 2')
+    capsys.readouterr()
+
+    vs_creator.main([source_id], pool=pool, manifest_path=manifest_path, upsert=True)
+    assert 'FAILED' not in capsys.readouterr().out
+    grouping = file_named(google, source_id, 'Condition_2_Dx')
+    assert grouping['id'] != trashed['id']
+    assert Manifest(manifest_path).outputs(source_id, 'Tab 2')['Condition_2_Dx'] == grouping['id']
+
+
+def test_second_upsert_run_creates_no_duplicates(capsys):
+    google, pool, source_id = fake_backend()
+    vs_creator.main([source_id], pool=pool, upsert=True)
+    first = {file['name']: file['id'] for file in value_set_files(google, source_id)}
+    capsys.readouterr()
+
+    vs_creator.main([source_id], pool=pool, upsert=True, workers=4)
+    output = capsys.readouterr().out
+    assert 'FAILED' not in output
+    assert '0 value sets created' in output
+    assert not duplicates(google, source_id)
+    assert {file['name']: file['id'] for file in value_set_files(google, source_id)} == first
+
+
+def test_concurrent_writes_of_one_value_set_create_one_file():
+    google, pool, source_id = fake_backend()
+    index = vs_creator.FileIndex()
+    moves = MoveQueue(pool.drive)
+    outputs = [vs_creator.OutputFiles(pool, moves, index=index) for _ in range(8)]
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(lambda output: output.write('Shared', 'concepts', [['Label', 'Shared']],
+                                                      [['Label', 'Code', 'System', 'Note']], gss.STAGING_FOLDER_ID),
+                          outputs))
+    moves.flush()
+    assert file_named(google, source_id, 'Shared')['parents'] == [gss.STAGING_FOLDER_ID]
+    assert sorted(output.action('Shared') for output in outputs) == ['Created'] + ['Updated'] * 7
+
+
+def set_icd_codes(google, source_id, tab, suffix):
+    """ give the first ICD-10 codes of a tab "suffix", e.g. '.x' to make them intensional """
+    values = google.sheet(google.file(source_id), tab)['values']
+    for row in values[2:5]:
+        row[2] = row[2].split('.')[0] + suffix
+    google.touch(google.file(source_id))
+
+
+def test_concept_vs_moves_between_folders(tmp_path, capsys):
+    google, pool, source_id = fake_backend()
+    manifest_path = str(tmp_path / 'manifest.json')
+    vs_creator.main([source_id], pool=pool, manifest_path=manifest_path)
+    staged = file_named(google, source_id, 'Condition_1_Dx (ICD-10)')
+    intensional = file_named(google, source_id, 'Condition_4_Dx (ICD-10)')
+    assert staged['parents'] == [gss.STAGING_FOLDER_ID]
+    assert intensional['parents'] == [gss.INTENSIONAL_FOLDER_ID]
+
+    # Tab 1 becomes intensional and Tab 4 stops being, with and without the listing of the folders
+    set_icd_codes(google, source_id, 'Tab 1', '.x')
+    set_icd_codes(google, source_id, 'Tab 4', '.1')
+    vs_creator.main([source_id], pool=pool, manifest_path=manifest_path)
+    assert file_named(google, source_id, 'Condition_1_Dx (ICD-10)') is staged
+    assert staged['parents'] == [gss.INTENSIONAL_FOLDER_ID]
+    assert file_named(google, source_id, 'Condition_4_Dx (ICD-10)') is intensional
+    assert intensional['parents'] == [gss.STAGING_FOLDER_ID]
+
+    set_icd_codes(google, source_id, 'Tab 1', '.1')
+    vs_creator.main([source_id], pool=pool, upsert=True)
+    assert 'FAILED' not in capsys.readouterr().out
+    assert file_named(google, source_id, 'Condition_1_Dx (ICD-10)') is staged
+    assert staged['parents'] == [gss.STAGING_FOLDER_ID]
+    assert not duplicates(google, source_id)
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_resume_after_a_crash_mid_tab(tmp_path, monkeypatch, capsys, workers):
+    clean_google, clean_pool, clean_source_id = fake_backend()
+    vs_creator.main([clean_source_id], pool=clean_pool)
+    expected = sorted(file['name'] for file in value_set_files(clean_google, clean_source_id))
+
+    google, pool, source_id = fake_backend()
+    journal_path = str(tmp_path / 'journal.jsonl')
+    write = vs_creator.OutputFiles.write
+    writes = []
+
+    def crashing_write(output, filename, *args):
+        # the run dies in the middle of a tab, with the moves of the files it created still queued
+        writes.append(filename)
+        if len(writes) == 12:
+            raise RuntimeError('crashed')
+        return write(output, filename, *args)
+
+    monkeypatch.setattr(vs_creator.OutputFiles, 'write', crashing_write)
+    with pytest.raises(RuntimeError):
+        vs_creator.main([source_id], pool=pool, workers=workers, journal_path=journal_path)
+    monkeypatch.setattr(vs_creator.OutputFiles, 'write', write)
+    capsys.readouterr()
+
+    vs_creator.main([source_id], pool=pool, workers=workers, journal_path=journal_path, resume=True)
+    output = capsys.readouterr().out
+    assert 'FAILED' not in output
+    assert 'tabs finished by the interrupted run' in output
+    assert not duplicates(google, source_id)
+    assert sorted(file['name'] for file in value_set_files(google, source_id)) == expected
+    stranded = [file['name'] for file in value_set_files(google, source_id) if 'root' in file['parents']]
+    assert stranded == []
+    # every grouping lists all of the concept vs's of its tab
+    for n in range(1, 7):
+        grouping = file_named(google, source_id, f'Condition_{n}_Dx')
+        listed = [row[0] for row in google.sheet(grouping, 'Subsets')['values'][1:]]
+        assert sorted(listed) == sorted(name for name in expected if name.startswith(f'Condition_{n}_Dx '))
+
+
+def test_resume_remakes_a_tab_with_a_failed_value_set(tmp_path, monkeypatch, capsys):
+    google, pool, source_id = fake_backend()
+    journal_path = str(tmp_path / 'journal.jsonl')
+    create = GSManager.create_vs_workbook
+
+    def failing_create(gsm, name, *args, **kwargs):
+        if name == 'Condition_2_Dx (MEDCODE)':
+            return None
+        return create(gsm, name, *args, **kwargs)
+
+    monkeypatch.setattr(GSManager, 'create_vs_workbook', failing_create)
+    vs_creator.main([source_id], pool=pool, journal_path=journal_path)
+    assert 'FAILED to create concept vs Condition_2_Dx (MEDCODE)' in capsys.readouterr().out
+    monkeypatch.setattr(GSManager, 'create_vs_workbook', create)
+
+    # the tab with the failure is not finished, so it is made again; its grouping is updated in place
+    vs_creator.main([source_id], pool=pool, journal_path=journal_path, resume=True)
+    output = capsys.readouterr().out
+    assert '5 tabs finished by the interrupted run' in output
+    assert '1 value sets created, 1 updated' in output
+    assert not duplicates(google, source_id)
+    grouping = file_named(google, source_id, 'Condition_2_Dx')
+    listed = [row[0] for row in google.sheet(grouping, 'Subsets')['values'][1:]]
+    assert 'Condition_2_Dx (MEDCODE)' in listed
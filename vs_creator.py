@@ -1,10 +1,22 @@
-from gstuff.gdrv import Drive
-from gstuff.gsht import GSManager
+from concurrent.futures import ThreadPoolExecutor
+from gstuff.cache import WorkbookCache
+from gstuff.clients import get_pool
+from gstuff.gdrv import MoveQueue
+from gstuff.inventory import FolderInventory
+from gstuff.journal import DEFAULT_JOURNAL_FILE
+from gstuff.journal import Journal
+from gstuff.manifest import DEFAULT_MANIFEST_FILE
+from gstuff.manifest import Manifest
+from gstuff.manifest import content_hash
 from gstuff.gsht import Sheet
+from gstuff.gsht import WorkbookHandle
 import googlesheetssettings as gss
+import argparse
+import threading
 import time
 
 # defining constants
+value_set_folder_ids = [gss.STAGING_FOLDER_ID, gss.INTENSIONAL_FOLDER_ID]
 dv_header_rows = 2
 dv_metadata_cols = 2
 
@@ -15,9 +27,9 @@ def get_metadata(sheet):
     metadata_labels = []
     metadata_values = []
     for i in range(dv_header_rows, min(sheet.rows,10)):
-        if sheet.values[i][0] != '':
-            metadata_labels.append(sheet.values[i][0])
-            metadata_values.append(sheet.values[i][1])
+        if sheet.get_cell(i, 0) != '':
+            metadata_labels.append(sheet.get_cell(i, 0))
+            metadata_values.append(sheet.get_cell(i, 1))
     metadata = dict(zip(metadata_labels, metadata_values))
     metadata_with_vs_type = metadata_add_vs_type(metadata)
     return metadata_with_vs_type
@@ -36,7 +48,7 @@ def metadata_add_vs_type(metadata):
 # pull out last row of headers & strip white space
 
 def get_sheet_headers(sheet):
-    sheet_headers = [header.strip() for header in sheet.values[dv_header_rows-1]]
+    sheet_headers = [header.strip() for header in sheet.get_row(dv_header_rows-1)]
     #sheet_headers = list(filter(None, sheet_headers)) #removes empty entries from the header list
     return sheet_headers
 
@@ -58,18 +70,7 @@ def find_indices(list, item):
 def get_codelists(code_cols, sheet, code_dict):
     """ pull out paired code-description lists, each matched with a coding system type (icd, snomed, etc.)
     """
-    first_row = sheet.get_row(dv_header_rows)
-    system_code_pair_dict = {}
-    for col in code_cols:
-        if first_row[col] != '':
-            for key in code_dict.keys():
-                column_pairs = code_dict[key][3]
-                if col in column_pairs:
-                    col1 = [sci_to_code(newline_strip(x)) for x in sheet.get_col(column_pairs[1])][2:]
-                    col2 = [sci_to_code(newline_strip(x)) for x in sheet.get_col(column_pairs[0])][2:]
-                    codes = [list(x) for x in list(set(zip(col1, col2)))] #set is to remove duplicates
-                    system_code_pair_dict[key] = codes
-    return system_code_pair_dict
+    return CodelistExtractor(code_cols, code_dict).extract(sheet).pairs
 
 def sci_to_code(code):
     """ convert codes in scientific notation in the Google sheet back into codes """
@@ -85,19 +86,241 @@ def newline_strip(label):
     return label2
 
 
+class TabCodelists:
+    """ the codelists found in one tab: the de-duplicated [label, code] pairs of each system, in
+        the order they first appear, and for each system whether its code column has any codes and
+        whether any of them is an ICD-style '.x' (intensional) code """
+
+    def __init__(self):
+        self.pairs = {}
+        self.has_codes = {}
+        self.intensional = {}
+
+
+class CodelistExtractor:
+    """ extracts the codelists of every system in a tab in one pass, using the column layout in
+        system_dict (see main); each column a system uses is read once per tab and each distinct cell
+        value is normalized once """
+
+    def __init__(self, code_cols, system_dict):
+        self.system_dict = system_dict
+        # the systems to look for when a code column is filled in on the first data row, in the
+        # order get_codelists has always reported them
+        self.triggers = [(col, [key for key in system_dict if col in system_dict[key][3]]) for col in code_cols]
+
+    def extract(self, sheet):
+        first_row = sheet.get_row(dv_header_rows)
+        systems = []
+        for col, keys in self.triggers:
+            if first_row[col] != '':
+                for key in keys:
+                    if key not in systems:
+                        systems.append(key)
+
+        raw = {}
+        normalized = {}
+        cache = {}
+        for key in systems:
+            for col in self.system_dict[key][3][:2]:
+                if col not in raw:
+                    raw[col] = list(sheet.get_col(col))[dv_header_rows:]
+                    normalized[col] = [cache[x] if x in cache else cache.setdefault(x, sci_to_code(newline_strip(x)))
+                                       for x in raw[col]]
+
+        codelists = TabCodelists()
+        for key in systems:
+            code_col, label_col = self.system_dict[key][3][:2]
+            # dict keys keep the first occurrence of each pair, in order
+            unique_pairs = dict.fromkeys(zip(normalized[label_col], normalized[code_col]))
+            codelists.pairs[key] = [list(x) for x in unique_pairs]
+            codes = raw[code_col]
+            codelists.has_codes[key] = any(code != '' for code in codes)
+            codelists.intensional[key] = any('.x' in code or '.X' in code for code in codes)
+        return codelists
+
+
+def report_created(value_set, description, log=print, action='Created'):
+    """ log the outcome of creating (or updating) a value set; creation returns None if it failed
+        even after retries """
+    if value_set is None:
+        log("FAILED to "+("update " if action == 'Updated' else "create ")+description)
+    else:
+        log(action+" "+description)
+
+
+class FileIndex:
+    """ the value set files in the target folders, {filename: (file id, folder id)}, shared by all
+        the tabs of a run. A filename is locked from the time it is looked up until its file is
+        written (see OutputFiles.write), so two tabs that make the same value set concurrently
+        never both create a file for it """
+
+    def __init__(self, files=None):
+        self.files = dict(files or {})
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def lock(self, filename):
+        with self._lock:
+            return self._locks.setdefault(filename, threading.Lock())
+
+    def get(self, filename):
+        with self._lock:
+            return self.files.get(filename)
+
+    def remove(self, filename):
+        with self._lock:
+            self.files.pop(filename, None)
+
+    def add(self, filename, file_id, folder_id):
+        with self._lock:
+            self.files[filename] = (file_id, folder_id)
+
+
+class OutputFiles:
+    """ writes the value sets made from one tab. A value set whose file already exists (it is in
+        "existing", {filename: (file id, folder id)}, or in the shared FileIndex "index" of the
+        target folders, which takes precedence when it is given) is updated in place, and moved if
+        it is in the other target folder; if the update fails it is reported as a failure rather
+        than creating a second file of the same name, unless the file turns out to have been
+        deleted or trashed, in which case it is created again and its filename kept in "missing".
+        The others are created, added to the index, and moved to their folder through "moves" if it
+        is given. The ids of the files written are kept in "written" and their folders in "folders".
+        With a journal each value set written is recorded in it, for the tab "tab" of the source
+        workbook "source"; "done" is {filename: (file id, folder id)} of the value sets that the interrupted run
+        being resumed already wrote, which are not written again """
+
+    def __init__(self, pool, moves=None, existing=None, index=None, journal=None, source=None, tab=None,
+                 done=None):
+        self.pool = pool
+        self.moves = moves
+        self.existing = existing or {}
+        self.folders = {}
+        self.index = index
+        self.journal = journal
+        self.source = source
+        self.tab = tab
+        self.done = done or {}
+        self.written = {}
+        self.missing = set()
+        self.actions = {}
+        self.failed = 0
+        self._lock = threading.Lock()
+
+    def write(self, filename, vs_kind, desc_vals, cont_vals, folder_id):
+        if filename in self.done:
+            file_id, target = self.done[filename]
+            with self._lock:
+                self.written[filename] = file_id
+                self.folders[filename] = target or folder_id
+                self.actions[filename] = 'Already created'
+            return WorkbookHandle(file_id, filename)
+        if self.index is None:
+            return self._write(filename, vs_kind, desc_vals, cont_vals, folder_id)
+        with self.index.lock(filename):
+            return self._write(filename, vs_kind, desc_vals, cont_vals, folder_id)
+
+    def _write(self, filename, vs_kind, desc_vals, cont_vals, folder_id):
+        gsm = self.pool.gsm()
+        file_id, current_folder = self.existing.get(filename, (None, None))
+        if self.index is not None:
+            file_id, current_folder = self.index.get(filename) or (file_id, current_folder)
+        updated = bool(file_id)
+        if updated:
+            value_set = gsm.update_vs_workbook(file_id, filename, vs_kind, desc_vals, cont_vals)
+            if value_set is None and self.pool.drive().exists(file_id) is False:
+                # the file was deleted or trashed since it was recorded, so it is made again
+                with self._lock:
+                    self.existing.pop(filename, None)
+                    self.missing.add(filename)
+                if self.index is not None:
+                    self.index.remove(filename)
+                updated = False
+            elif value_set is not None and current_folder and current_folder != folder_id:
+                self._move(file_id, current_folder, folder_id)
+        if not updated:
+            value_set = gsm.create_vs_workbook(filename, vs_kind, desc_vals, cont_vals, folder_id, fast=True,
+                                               moves=self.moves)
+        with self._lock:
+            self.actions[filename] = 'Updated' if updated else 'Created'
+            if value_set is None:
+                self.failed += 1
+                return None
+            self.written[filename] = value_set.file_id
+            self.folders[filename] = folder_id
+        if self.index is not None:
+            self.index.add(filename, value_set.file_id, folder_id)
+        if self.journal is not None:
+            # a file that was created still has to be moved to its folder, so the folder is recorded
+            self.journal.record('grouping' if vs_kind == 'subsets' else 'concept', source=self.source, tab=self.tab,
+                                filename=filename, file_id=value_set.file_id, folder=None if updated else folder_id,
+                                target=folder_id)
+        return value_set
+
+    def _move(self, file_id, source, target):
+        # e.g. an ICD-10 value set that has become intensional, or stopped being
+        if self.moves is not None:
+            self.moves.add(file_id, source, target)
+        else:
+            self.pool.drive().move(file_id, source, target)
+
+    def finish(self):
+        """ record in the journal that the tab is done, if every value set of it was written; a tab
+            with failures is made again when the run is resumed """
+        if self.journal is not None and not self.failed:
+            self.journal.record('tab_done', source=self.source, tab=self.tab)
+
+    def counts(self):
+        """ return {action: number of value sets written that way}, for the ones that were written """
+        with self._lock:
+            counts = {}
+            for filename in self.written:
+                counts[self.actions[filename]] = counts.get(self.actions[filename], 0) + 1
+            return counts
+
+    def action(self, filename):
+        with self._lock:
+            return self.actions.get(filename, 'Created')
+
+
+class ResumeState:
+    """ the steps an interrupted run completed, read from its journal: the value sets written for
+        each (source workbook, tab), the tabs that were finished with all of their value sets
+        written, and the files created but not yet moved to their folders. The grouping vs of an
+        unfinished tab is kept apart in "groupings": it is written again, in place, so that it lists
+        the concept vs's made when the tab is finished """
+
+    def __init__(self, entries):
+        # {(source, tab): {filename: (file id, folder id)}}
+        self.written = {}
+        self.groupings = {}
+        self.done = set()
+        self.unmoved = {}
+        for entry in entries:
+            if entry['step'] in ('concept', 'grouping'):
+                key = (entry['source'], entry['tab'])
+                location = (entry['file_id'], entry.get('target'))
+                self.written.setdefault(key, {})[entry['filename']] = location
+                if entry['step'] == 'grouping':
+                    self.groupings.setdefault(key, {})[entry['filename']] = location
+                if entry.get('folder'):
+                    self.unmoved[entry['file_id']] = (entry['source'], entry['folder'])
+            elif entry['step'] == 'tab_done':
+                self.done.add((entry['source'], entry['tab']))
+            elif entry['step'] == 'moved':
+                for file_id in entry['file_ids']:
+                    self.unmoved.pop(file_id, None)
+
+
 # create a grouping value set
 
-def create_grouping_vs(sheet, cont_vals):
+def create_grouping_vs(sheet, cont_vals, pool=None, log=print, output=None):
     metadata = get_metadata(sheet) #a  dictionary
     filename = metadata['Filename']
     metadata.update({'Content Type':'subsets'})
     desc_vals = list(map(list, metadata.items()))[1:]
-    drive = Drive()
-    gsm = GSManager(drive.credentials) 
-    value_set = gsm.create_vs_workbook(filename, 'subsets', desc_vals, cont_vals)
-    drive.move(value_set.file_id, None, gss.STAGING_FOLDER_ID)
-    print("Created grouping vs "+filename)
-#    time.sleep(1)
+    output = output or OutputFiles(pool or get_pool())
+    value_set = output.write(filename, 'subsets', desc_vals, cont_vals, gss.STAGING_FOLDER_ID)
+    report_created(value_set, "grouping vs "+filename, log, output.action(filename))
 
 
 # create filename labels appropriate for concept value sets (i.e. "Covid-19_Dx (ICD-10-CM)")
@@ -114,7 +337,7 @@ def update_filename_label(dict, metadata, system):
 # create concept value set for any system besides ICD-10 (where intensional
 # defs exist), DMD/PID, generic drugs
 
-def create_concept_vs(sheet, system_dict, system, code_pairs):
+def create_concept_vs(sheet, system_dict, system, code_pairs, pool=None, log=print, output=None):
     metadata = get_metadata(sheet) #a dictionary
     updated_metadata = update_filename_label(system_dict, metadata, system)
 
@@ -129,18 +352,17 @@ def create_concept_vs(sheet, system_dict, system, code_pairs):
             code_pair.append(system_dict[system][2])
             cont_vals.append(code_pair)
 
-    drive = Drive()
-    gsm = GSManager(drive.credentials)
-    value_set = gsm.create_vs_workbook(filename, 'concepts', desc_vals, cont_vals)
-    drive.move(value_set.file_id, None, gss.STAGING_FOLDER_ID)
-    print("Created concept vs "+filename)
-#    time.sleep(1)
+    output = output or OutputFiles(pool or get_pool())
+    value_set = output.write(filename, 'concepts', desc_vals, cont_vals, gss.STAGING_FOLDER_ID)
+    report_created(value_set, "concept vs "+filename, log, output.action(filename))
+    if value_set is None:
+        return None
     return filename,label
 
 
 # create concept value set for ICD-10 (where intensional defs exist)
 
-def create_icd_intensional_vs(sheet, system_dict, system, code_pairs):
+def create_icd_intensional_vs(sheet, system_dict, system, code_pairs, pool=None, log=print, output=None):
     metadata = get_metadata(sheet) #a dictionary
     updated_metadata = update_filename_label(system_dict, metadata, system)
 
@@ -157,17 +379,16 @@ def create_icd_intensional_vs(sheet, system_dict, system, code_pairs):
     desc_vals = list(map(list, updated_metadata.items()))[1:]
     cont_vals = [['Label', 'Code', 'System', 'Note']]
 
-    drive = Drive()
-    gsm = GSManager(drive.credentials)
-    value_set = gsm.create_vs_workbook(filename, 'concepts', desc_vals, cont_vals)
-    drive.move(value_set.file_id, None, gss.INTENSIONAL_FOLDER_ID)
-    print("Created concept vs "+filename+" (INTENSIONAL)")
-#    time.sleep(1)
+    output = output or OutputFiles(pool or get_pool())
+    value_set = output.write(filename, 'concepts', desc_vals, cont_vals, gss.INTENSIONAL_FOLDER_ID)
+    report_created(value_set, "concept vs "+filename+" (INTENSIONAL)", log, output.action(filename))
+    if value_set is None:
+        return None
     return filename,label
 
 # create concept value set for DMD/DMD PID codelists
 
-def create_dmd_vs(sheet, system_dict, system, code_pairs):
+def create_dmd_vs(sheet, system_dict, system, code_pairs, pool=None, log=print, output=None):
     metadata = get_metadata(sheet) #a dictionary
     updated_metadata = update_filename_label(system_dict, metadata, system)
 
@@ -182,18 +403,17 @@ def create_dmd_vs(sheet, system_dict, system, code_pairs):
             code_pair.append(system_dict[system][2])
             cont_vals.append(code_pair)
 
-    drive = Drive()
-    gsm = GSManager(drive.credentials)
-    value_set = gsm.create_vs_workbook(filename, 'concepts', desc_vals, cont_vals)
-    drive.move(value_set.file_id, None, gss.STAGING_FOLDER_ID)
-    print("Created concept vs "+filename)
-#    time.sleep(1)
+    output = output or OutputFiles(pool or get_pool())
+    value_set = output.write(filename, 'concepts', desc_vals, cont_vals, gss.STAGING_FOLDER_ID)
+    report_created(value_set, "concept vs "+filename, log, output.action(filename))
+    if value_set is None:
+        return None
     return filename,label
 
 
 # create concept value set for generic drug
 
-def create_generic_vs(sheet, system_dict, system, code_pairs):
+def create_generic_vs(sheet, system_dict, system, code_pairs, pool=None, log=print, output=None):
     metadata = get_metadata(sheet) #a dictionary
     updated_metadata = update_filename_label(system_dict, metadata, system)
 
@@ -211,47 +431,221 @@ def create_generic_vs(sheet, system_dict, system, code_pairs):
             row[6] = code_pair[0]
             cont_vals.append(row)
 
-    drive = Drive()
-    gsm = GSManager(drive.credentials)
-    value_set = gsm.create_vs_workbook(filename, 'concepts', desc_vals, cont_vals)
-    drive.move(value_set.file_id, None, gss.STAGING_FOLDER_ID)
-    print("Created concept vs "+filename)
-#    time.sleep(1)
+    output = output or OutputFiles(pool or get_pool())
+    value_set = output.write(filename, 'concepts', desc_vals, cont_vals, gss.STAGING_FOLDER_ID)
+    report_created(value_set, "concept vs "+filename, log, output.action(filename))
+    if value_set is None:
+        return None
     return filename,label
 
 
-def create_value_sets(sheet, code_cols, system_dict):
+def choose_vs_creator(codelists, system):
+    """ return the function that creates the concept vs for the given system, or None if the
+        tab has no codes for it """
+    if system == 'name':
+        return create_generic_vs
+    elif system in ('dmd_pid', 'dmd'):
+        if codelists.has_codes[system]:
+            return create_dmd_vs
+    elif system == 'icd':
+        if codelists.intensional[system]:
+            return create_icd_intensional_vs
+        else:
+            return create_concept_vs
+    else:
+        return create_concept_vs
+    return None
+
+
+def create_value_sets(sheet, code_cols, system_dict, pool=None, log=print, executor=None, extractor=None, output=None):
     """ create concept vs's for each of the codelist systems represented in the given sheet;
         store their filenames and labels for use in the grouping value set, create one 
-        grouping vs based on that """
+        grouping vs based on that. If an executor is given the concept vs's are created
+        concurrently on it; the grouping vs is still created last and the log keeps the
+        system order. The value sets are written through "output" (see OutputFiles) """
     
-    code_pair_dict = get_codelists(code_cols, sheet, system_dict)
+    extractor = extractor or CodelistExtractor(code_cols, system_dict)
+    codelists = extractor.extract(sheet)
+    code_pair_dict = codelists.pairs
     grouping_cont_vals = [['Filename', 'Value Set Label', 'Note']]
+    creators = []
     for system in code_pair_dict:
-        if system == 'name':
-            name, label = create_generic_vs(sheet, system_dict, system, code_pair_dict[system])
-        elif system == 'dmd_pid':
-            codes = sheet.get_col(10)[2:]
-            if any(code != '' for code in codes):
-                name, label = create_dmd_vs(sheet, system_dict, system, code_pair_dict[system])
-        elif system == 'dmd':
-            codes = sheet.get_col(11)[2:]
-            if any(code != '' for code in codes):
-                name, label = create_dmd_vs(sheet, system_dict, system, code_pair_dict[system])
-        elif system == 'icd':
-            codes = sheet.get_col(2)[2:]
-            if any('.x' in code or '.X' in code for code in codes):
-                name, label = create_icd_intensional_vs(sheet, system_dict, system, code_pair_dict[system])
-            else:
-                name, label = create_concept_vs(sheet, system_dict, system, code_pair_dict[system])
-        else:
-            name, label = create_concept_vs(sheet, system_dict, system, code_pair_dict[system])
+        creator = choose_vs_creator(codelists, system)
+        if creator:
+            creators.append((system, creator))
+    if executor is None:
+        results = [creator(sheet, system_dict, system, code_pair_dict[system], pool, log, output)
+                   for system, creator in creators]
+    else:
+        logs = [[] for _ in creators]
+        futures = [executor.submit(creator, sheet, system_dict, system, code_pair_dict[system], pool, logs[i].append,
+                                   output)
+                   for i, (system, creator) in enumerate(creators)]
+        results = [future.result() for future in futures]
+        for lines in logs:
+            for line in lines:
+                log(line)
+    for result in results:
+        # a concept vs that could not be written is not listed in the grouping vs
+        if result is None:
+            continue
+        name, label = result
         grouping_cont_val_row = [name, label, '']
         grouping_cont_vals.append(grouping_cont_val_row)
-    create_grouping_vs(sheet, grouping_cont_vals)
+    create_grouping_vs(sheet, grouping_cont_vals, pool, log, output)
+    if output is not None:
+        output.finish()
+
+
+def run_tab(sheet, code_cols, system_dict, pool, executor, extractor=None, output=None):
+    """ create the value sets for one tab and return the lines it logged """
+    lines = []
+    create_value_sets(sheet, code_cols, system_dict, pool, lines.append, executor, extractor, output)
+    return lines
+
+
+def load_workbook(pool, file_id, cache_dir=None):
+    """ load a source workbook in bulk, from the snapshot cache in cache_dir if it is given and
+        the workbook has not changed since it was cached; the sheets are stored by column, which
+        is how the codelists are read """
+    cache = WorkbookCache(pool.drive(), cache_dir) if cache_dir else None
+    return pool.gsm().get_workbook(file_id, bulk=True, cache=cache, columnar=True)
+
+
+def tab_hash(sheet, code_cols, system_dict):
+    """ the content hash of everything in a tab that its value sets are made from: the metadata
+        (columns A and B), the code and description columns, and the settings that map them """
+    columns = [0, 1] + code_cols + [col for system in system_dict.values() for col in system[3]]
+    return content_hash(sheet, columns, {'code_cols': code_cols, 'system_dict': system_dict})
+
+
+def process_workbook(source_wb, code_cols, system_dict, pool, workers=1, manifest=None, index=None, journal=None,
+                     resume=None):
+    """ create the value sets for every tab of a source workbook and return a summary of the run;
+        with a manifest, tabs that have not changed since their value sets were last made are
+        skipped and the value sets of the ones that have are updated in place. With an index of
+        the target folders (a FileIndex) any value set that already has a file there is updated
+        in place instead of being created again, whatever the manifest recorded. With a journal
+        every value set written and every batch of moves is recorded in it; "resume" is the
+        ResumeState of an interrupted run, whose finished tabs are skipped and whose value sets
+        are not written again """
+    start = time.monotonic()
+    log = print
+    workbook_name = source_wb.name
+    print(workbook_name+' started.')
 
+    tabs = source_wb.sheet_names()
+    extractor = CodelistExtractor(code_cols, system_dict)
+    # new value sets are moved to their folders in batches rather than one request each
+    on_moved = None
+    if journal is not None:
+        on_moved = lambda moved: journal.record('moved', file_ids=[file_id for file_id in moved if moved[file_id]])
+    moves = MoveQueue(pool.drive, on_moved=on_moved)
+    if resume is not None:
+        # files the interrupted run created but did not get to move
+        for file_id, (source, folder_id) in resume.unmoved.items():
+            if source == source_wb.file_id:
+                moves.add(file_id, 'root', folder_id)
+
+    # add the 'category' header where it is missing; this writes to the source workbook so it
+    # is done up front, on this thread, and saved for all tabs with one request
+    for tab in tabs:
+        working_sheet = source_wb.sheets.get(tab)
+        if working_sheet.cols < 16:
+            working_sheet.write_cell(2,15,'category')
+    source_wb.flush()
+
+    outputs = {}
+    skipped = 0
+    resumed = 0
+    for tab in tabs:
+        key = (source_wb.file_id, tab)
+        if resume is not None and key in resume.done:
+            resumed += 1
+            if manifest is not None:
+                written = resume.written.get(key, {})
+                manifest.record(source_wb.file_id, tab, tab_hash(source_wb.sheets.get(tab), code_cols, system_dict),
+                                {filename: file_id for filename, (file_id, _) in written.items()},
+                                {filename: folder_id for filename, (_, folder_id) in written.items() if folder_id})
+            continue
+        existing = None
+        if manifest is not None:
+            content = tab_hash(source_wb.sheets.get(tab), code_cols, system_dict)
+            if manifest.unchanged(source_wb.file_id, tab, content):
+                skipped += 1
+                continue
+            # the listing of the target folders in the index is more current than what earlier runs recorded
+            if index is None:
+                existing = manifest.locations(source_wb.file_id, tab)
+        done = None
+        if resume is not None:
+            groupings = resume.groupings.get(key, {})
+            done = {filename: location for filename, location in resume.written.get(key, {}).items()
+                    if filename not in groupings}
+            existing = {**(existing or {}), **groupings}
+        outputs[tab] = OutputFiles(pool, moves, existing, index, journal, source_wb.file_id, tab, done)
+    if skipped:
+        print(f'{skipped} tabs unchanged since their value sets were made, skipped.')
+    if resumed:
+        print(f'{resumed} tabs finished by the interrupted run, skipped.')
+    tabs = list(outputs)
+
+    if workers > 1:
+        # tabs are processed on one pool and their concept vs's created on another, so a tab
+        # waiting for its concept vs's never holds up the workers that create them; all
+        # requests share the pool's quota budget
+        with ThreadPoolExecutor(workers) as tab_executor, ThreadPoolExecutor(workers) as vs_executor:
+            futures = [tab_executor.submit(run_tab, source_wb.sheets.get(tab), code_cols, system_dict, pool, vs_executor,
+                                           extractor, outputs[tab])
+                       for tab in tabs]
+            for future in futures:
+                for line in future.result():
+                    log(line)
+    else:
+        for tab in tabs:
+            create_value_sets(source_wb.sheets.get(tab), code_cols, system_dict, pool, log, extractor=extractor,
+                              output=outputs[tab])
+    unmoved = moves.flush()
+    if unmoved:
+        print(f'{len(unmoved)} value sets could not be moved to their folders and are in My Drive')
+
+    if manifest is not None:
+        for tab, output in outputs.items():
+            # a tab with failures is made again next time; the files it did write are updated then
+            content = tab_hash(source_wb.sheets.get(tab), code_cols, system_dict) if not output.failed else None
+            manifest.forget(source_wb.file_id, tab, output.missing)
+            manifest.record(source_wb.file_id, tab, content, output.written, output.folders)
+        manifest.save()
 
-def main():
+    print(workbook_name+' done.')
+    counts = {'Created': 0, 'Updated': 0, 'Already created': 0}
+    for output in outputs.values():
+        for action, count in output.counts().items():
+            counts[action] += count
+    return {
+        'file_id': source_wb.file_id,
+        'name': workbook_name,
+        'tabs': len(tabs),
+        'skipped': skipped,
+        'resumed': resumed,
+        'created': counts['Created'],
+        'updated': counts['Updated'],
+        'already_created': counts['Already created'],
+        'failed': sum(output.failed for output in outputs.values()),
+        'seconds': time.monotonic() - start,
+    }
+
+
+def print_summary(summaries):
+    print('Summary:')
+    for summary in summaries:
+        print(f"{summary['name'] or summary['file_id']}: {summary['tabs']} tabs, {summary['skipped']} unchanged, "
+              f"{summary['resumed']} resumed, {summary['created']} value sets created, {summary['updated']} updated, "
+              f"{summary['already_created']} already created, {summary['failed']} failed, {summary['seconds']:.0f}s")
+
+
+def main(workbook_ids=None, workers=1, cache_dir=None, pool=None, manifest_path=None, upsert=False, journal_path=None,
+         resume=False):
     code_cols = [2, 4, 5, 8, 10, 11, 12, 13]
     system_dict = {
         #'system_type':['header','filename_label','system','columns','concepts or drugs'],
@@ -263,27 +657,51 @@ def main():
         'dmd':['zyxw', ' (DMD)','DMD',[11,12],'drugs'],
         'name':['Generic', ' (Name)','',[13, 14],'drugs']
         }
-
-    # create a Google Drive wrapper object
-    drive = Drive()
-
-    # create a Google Sheet Manager object
-    gsm = GSManager(drive.credentials)
-
-    source_wb = gsm.get_workbook(gss.VALUE_SET_11)
-    workbook_name = source_wb.name
-    print(workbook_name+' started.')
-
-    tabs = source_wb.get_sheet_names()
-
-    for tab in tabs: 
-        working_sheet = source_wb.sheets.get(tab)
-        if working_sheet.cols < 16:
-            working_sheet.write_cell(2,15,'category')
-            working_sheet.save()
-        create_value_sets(working_sheet, code_cols, system_dict)
-
-    print(workbook_name+' done.')
+    workbook_ids = workbook_ids or [gss.VALUE_SET_11]
+
+    # the shared credentials and Google API clients used by every step of the run
+    pool = pool or get_pool()
+    manifest = Manifest(manifest_path) if manifest_path else None
+    # the files already in the target folders, listed once for the whole run
+    index = FileIndex(FolderInventory(pool.drive(), value_set_folder_ids).refresh().locations()) if upsert else None
+    # every step is journaled so that an interrupted run can be resumed from the journal
+    journal = Journal(journal_path, resume) if journal_path else None
+    state = ResumeState(journal.entries) if journal is not None and resume else None
+
+    # the next workbook is loaded on a background thread while the current one is processed
+    summaries = []
+    with ThreadPoolExecutor(1) as loader:
+        next_wb = loader.submit(load_workbook, pool, workbook_ids[0], cache_dir)
+        for i in range(len(workbook_ids)):
+            source_wb = next_wb.result()
+            if i+1 < len(workbook_ids):
+                next_wb = loader.submit(load_workbook, pool, workbook_ids[i+1], cache_dir)
+            # the loader thread keeps using its own service, so writes to this workbook go through this thread's
+            source_wb.service = pool.sheets_service()
+            summaries.append(process_workbook(source_wb, code_cols, system_dict, pool, workers, manifest, index,
+                                              journal, state))
+
+    if journal is not None:
+        journal.close()
+    print_summary(summaries)
+    print(pool.executor.summary())
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Create value sets from source workbooks.')
+    parser.add_argument('workbook_ids', nargs='*', help='ids of the source workbooks (default: VALUE_SET_11)')
+    parser.add_argument('--all', action='store_true', help='process every workbook in STUDY_HANDLE_LIST')
+    parser.add_argument('--workers', type=int, default=1, help='number of tabs and value sets to process concurrently')
+    parser.add_argument('--cache', metavar='DIR', help='reuse cached copies of unchanged source workbooks from DIR')
+    parser.add_argument('--manifest', nargs='?', const=DEFAULT_MANIFEST_FILE, metavar='PATH',
+                        help='only remake the value sets of tabs that changed since the run that wrote the manifest at '
+                             f'PATH (default: {DEFAULT_MANIFEST_FILE}), updating their files in place')
+    parser.add_argument('--upsert', action='store_true',
+                        help='update value sets that already have a file of the same name in the staging or intensional '
+                             'folder instead of creating another one')
+    parser.add_argument('--journal', default=DEFAULT_JOURNAL_FILE, metavar='PATH',
+                        help=f'record each completed step in the journal at PATH (default: {DEFAULT_JOURNAL_FILE})')
+    parser.add_argument('--resume', action='store_true',
+                        help='continue an interrupted run from its journal, skipping the steps it completed')
+    args = parser.parse_args()
+    main(gss.STUDY_HANDLE_LIST if args.all else args.workbook_ids, args.workers, args.cache, manifest_path=args.manifest,
+         upsert=args.upsert, journal_path=args.journal, resume=args.resume)
\ No newline at end of file